@@ -3,26 +3,39 @@ Run module update on remove server
 """
 import os
 import time
+import argparse
 import json
 import sys
 import datetime
 import threading
+import queue
+import glob
+import concurrent.futures
+from urllib.parse import urlparse
 import traceback
 import xmlrpc.client
+import itertools
+import contextlib
+import uuid
+import errno
+import base64
+import secrets
+import random
+import abc
 from xmlrpc.client import Transport
 from http import client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import wave
-import pyaudio
-import PySimpleGUI as sg
-from cryptography.fernet import Fernet
+# GUI (PySimpleGUI), audio (pyaudio) and crypto (cryptography) are imported when used, the console mode can run on
+# headless machines without Tk or PortAudio and starts faster
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
 VERSION = '2.0'
 FERNET_KEY = 'ORUR_FERNET_KEY'
-INIT_STATE_EVENT = '--INIT-STATE--'
+# API token of the upgrade service (`--serve`), the requests must have header `Authorization: Bearer <token>`
+SERVICE_TOKEN = 'ORUR_SERVICE_TOKEN'
 color_allow = True
-event, values, is_cancel, is_running, is_exit = INIT_STATE_EVENT, {}, False, False, False
 
 try:
     from termcolor import colored
@@ -45,87 +58,1474 @@ class Config:
     username: str = "admin"
     password: str
     modules_to_update: list = []
-    language_to_update: str = ""
+    language_to_update: list = []
+    batch_update: bool = False
+    connect_timeout: float = 10.0
+    read_timeout: float = 15 * 60
+    gzip_request: bool = False
+    protocol: str = "xmlrpc"
+    only_changed: bool = False
+    force_update: bool = False
+    collapse_dependencies: bool = False
+    async_upgrade: bool = False
+    poll_interval: float = 2.0
+    translation_chunk_size: int = 0
+    translation_scope: str = "upgraded"
+    translation_force: bool = False
+    metrics: bool = False
+    prometheus_dir: str = ""
+    resume: bool = False
+    session_ttl: float = 3600
+    busy_retries: int = 3
+    busy_backoff: float = 10.0
+    profile: bool = False
+    profile_top: int = 20
+    profile_file: bool = False
     config_file: str = ""
 
-    def __init__(self, url: str, db: str, password: str, modules_to_update: list, username: str = "admin"):
+    def __init__(self, url: str, db: str, password: str, modules_to_update: list, username: str = "admin",
+                 language_to_update: list = None, batch_update: bool = False, connect_timeout: float = 10.0,
+                 read_timeout: float = 15 * 60, gzip_request: bool = False, protocol: str = "xmlrpc",
+                 only_changed: bool = False, force_update: bool = False, collapse_dependencies: bool = False,
+                 async_upgrade: bool = False, poll_interval: float = 2.0, translation_chunk_size: int = 0,
+                 translation_scope: str = "upgraded", translation_force: bool = False, metrics: bool = False,
+                 prometheus_dir: str = "",
+                 resume: bool = False, session_ttl: float = 3600, busy_retries: int = 3, busy_backoff: float = 10.0,
+                 profile: bool = False, profile_top: int = 20, profile_file: bool = False):
         self.url = url
         self.db = db
         self.username = username
         self.password = password
         self.modules_to_update = modules_to_update
-        self.language_to_update = ""
+        # one language code or list of codes, see `language_codes`
+        self.language_to_update = language_to_update or []
+        self.batch_update = batch_update
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.gzip_request = gzip_request
+        self.protocol = protocol
+        self.only_changed = only_changed
+        self.force_update = force_update
+        self.collapse_dependencies = collapse_dependencies
+        self.async_upgrade = async_upgrade
+        self.poll_interval = poll_interval
+        self.translation_chunk_size = translation_chunk_size
+        self.translation_scope = translation_scope
+        self.translation_force = translation_force
+        self.metrics = metrics
+        self.prometheus_dir = prometheus_dir
+        self.resume = resume
+        self.session_ttl = session_ttl
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+        self.profile = profile
+        self.profile_top = profile_top
+        self.profile_file = profile_file
+
+
+class _ReadTimeoutMixin:
+    """ Use `timeout` to connect, then switch socket to `read_timeout` for the request / response """
+    read_timeout: float = None
+
+    def connect(self):
+        super().connect()
+        if self.read_timeout:
+            self.sock.settimeout(self.read_timeout)
+
+
+class TimeoutHTTPConnection(_ReadTimeoutMixin, client.HTTPConnection):
+    pass
+
+
+class TimeoutHTTPSConnection(_ReadTimeoutMixin, client.HTTPSConnection):
+    pass
+
+
+class ConnectionPool:
+    """ Keep-alive HTTP(S) connections, idle connections are pooled per (scheme, host) and shared by all transports """
+
+    def __init__(self, max_idle: int = 4, max_idle_time: float = 30.0):
+        self.max_idle = max_idle
+        self.max_idle_time = max_idle_time
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme: str, host: str, connect_timeout: float, read_timeout: float, context=None):
+        conn = None
+        with self._lock:
+            idle = self._idle.get((scheme, host), [])
+            while idle and conn is None:
+                conn, released_at = idle.pop()
+                if time.time() - released_at > self.max_idle_time:
+                    # server may already close the keep-alive connection
+                    conn.close()
+                    conn = None
+        if conn is None:
+            if scheme == 'https':
+                conn = TimeoutHTTPSConnection(host, timeout=connect_timeout, context=context)
+            else:
+                conn = TimeoutHTTPConnection(host, timeout=connect_timeout)
+        conn.read_timeout = read_timeout
+        if conn.sock:
+            conn.sock.settimeout(read_timeout)
+        return conn
+
+    def release(self, scheme: str, host: str, conn: client.HTTPConnection):
+        if conn.sock is None:
+            # closed by server ("Connection: close") or by error, nothing to reuse
+            return
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, released_at in connections:
+                conn.close()
+
+
+connection_pool = ConnectionPool()
+
+
+class PooledTransport(Transport):
+    """
+    XML-RPC transport (HTTP and HTTPS) use keep-alive connections from `connection_pool`,
+    response is accepted in gzip encoding, request is sent in gzip encoding if `gzip_request` is set
+    """
+
+    def __init__(self, scheme: str = 'http', connect_timeout: float = 10.0, timeout: float = 15 * 60,
+                 gzip_request: bool = False, context=None):
+        super().__init__()
+        self.scheme = scheme
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.context = context
+        self.encode_threshold = 1024 if gzip_request else None
+        self._pool_host = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        conn = connection_pool.acquire(self.scheme, chost, self.connect_timeout, self.timeout, self.context)
+        self._pool_host = chost
+        self._connection = host, conn
+        return conn
+
+    def release(self):
+        host, conn = self._connection
+        self._connection = (None, None)
+        if conn:
+            connection_pool.release(self.scheme, self._pool_host, conn)
+
+    def send_content(self, connection, request_body):
+        if self.encode_threshold is not None and self.encode_threshold < len(request_body):
+            connection.putheader("Content-Encoding", "gzip")
+            request_body = xmlrpc.client.gzip_encode(request_body)
+        self.bytes_sent += len(request_body)
+        connection.putheader("Content-Length", str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def parse_response(self, response):
+        data = response.read()
+        self.bytes_received += len(data)
+        if response.getheader("Content-Encoding", "") == "gzip":
+            data = xmlrpc.client.gzip_decode(data, max_decode=-1)
+        parser, unmarshaller = self.getparser()
+        parser.feed(data)
+        parser.close()
+        return unmarshaller.close()
+
+    def single_request(self, host, handler, request_body, verbose=False):
+        try:
+            result = super().single_request(host, handler, request_body, verbose)
+        except xmlrpc.client.Fault:
+            # fault response is read completely, the connection is still usable
+            self.release()
+            raise
+        except BaseException:
+            self.close()
+            raise
+        self.release()
+        return result
+
+
+def server_proxy(cf: Config, endpoint: str, allow_none: bool = False, timeout: float = None):
+    """ Create XML-RPC proxy to endpoint `common` or `object` of remote server use pooled transport """
+    transport = PooledTransport(urlparse(cf.url).scheme or 'http', cf.connect_timeout,
+                                timeout or cf.read_timeout, cf.gzip_request)
+    return xmlrpc.client.ServerProxy(f'{cf.url}/xmlrpc/2/{endpoint}', transport=transport, allow_none=allow_none)
+
+
+class RpcBackend(abc.ABC):
+    """
+    Remote call backend, provide `version`, `authenticate` and `execute_kw` like the XML-RPC proxies,
+    remote errors are raised as `xmlrpc.client.Fault` on all backends. A backend defines `call`.
+    """
+    name = ''
+
+    def __init__(self, cf: Config):
+        self.cf = cf
+        self.calls = 0
+        self.call_time = 0.0
+        # RunMetrics to record timing of each call
+        self.metrics = None
+
+    @property
+    def bytes_sent(self) -> int:
+        return 0
+
+    @property
+    def bytes_received(self) -> int:
+        return 0
+
+    @abc.abstractmethod
+    def call(self, service: str, method: str, *args):
+        """ Call `method` of `service` ('common' or 'object') on the server, timing and metrics are done by `_call` """
+
+    def _call(self, service: str, method: str, *args):
+        start_time = time.time()
+        bytes_sent, bytes_received = self.bytes_sent, self.bytes_received
+        error = None
+        try:
+            return self.call(service, method, *args)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.calls += 1
+            self.call_time += time.time() - start_time
+            if self.metrics:
+                # model and method of execute_kw
+                self.metrics.add_rpc(service, *(args[3:5] if method == 'execute_kw' else ('', method)),
+                                     start_time=start_time, bytes_sent=self.bytes_sent - bytes_sent,
+                                     bytes_received=self.bytes_received - bytes_received, error=error)
+
+    def version(self) -> dict:
+        return self._call('common', 'version')
+
+    def authenticate(self, db: str, username: str, password: str, user_agent_env: dict):
+        return self._call('common', 'authenticate', db, username, password, user_agent_env)
+
+    def execute_kw(self, db: str, uid: int, password: str, model: str, method: str, args: list, kwargs: dict = None):
+        return self._call('object', 'execute_kw', db, uid, password, model, method, args, kwargs or {})
+
+
+class XmlRpcBackend(RpcBackend):
+    """ Remote call to endpoints /xmlrpc/2/common and /xmlrpc/2/object """
+    name = 'xmlrpc'
+
+    def __init__(self, cf: Config, allow_none: bool = False):
+        super().__init__(cf)
+        self.proxies = {
+            'common': server_proxy(cf, 'common'),
+            'object': server_proxy(cf, 'object', allow_none=allow_none),
+        }
+
+    @property
+    def bytes_sent(self) -> int:
+        return sum(proxy('transport').bytes_sent for proxy in self.proxies.values())
+
+    @property
+    def bytes_received(self) -> int:
+        return sum(proxy('transport').bytes_received for proxy in self.proxies.values())
+
+    def call(self, service: str, method: str, *args):
+        return getattr(self.proxies[service], method)(*args)
+
+
+class JsonRpcBackend(RpcBackend):
+    """ Remote call to endpoint /jsonrpc, use keep-alive connections from `connection_pool` """
+    name = 'jsonrpc'
+
+    def __init__(self, cf: Config, allow_none: bool = False):
+        super().__init__(cf)
+        url = urlparse(cf.url)
+        self.scheme = url.scheme or 'http'
+        self.host = url.netloc
+        self.path = url.path.rstrip('/') + '/jsonrpc'
+        self._ids = itertools.count(1)
+        self._bytes_sent = 0
+        self._bytes_received = 0
+
+    @property
+    def bytes_sent(self) -> int:
+        return self._bytes_sent
+
+    @property
+    def bytes_received(self) -> int:
+        return self._bytes_received
+
+    def _request(self, body: bytes, headers: dict):
+        conn = connection_pool.acquire(self.scheme, self.host, self.cf.connect_timeout, self.cf.read_timeout)
+        try:
+            conn.request('POST', self.path, body, headers)
+            response = conn.getresponse()
+            data = response.read()
+        except BaseException:
+            conn.close()
+            raise
+        connection_pool.release(self.scheme, self.host, conn)
+        return response, data
+
+    def call(self, service: str, method: str, *args):
+        body = json.dumps({"jsonrpc": "2.0", "method": "call", "id": next(self._ids),
+                           "params": {"service": service, "method": method, "args": args}}).encode()
+        headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+        if self.cf.gzip_request and len(body) > 1024:
+            body = xmlrpc.client.gzip_encode(body)
+            headers['Content-Encoding'] = 'gzip'
+        for i in (0, 1):
+            # retry one time if the keep-alive connection is closed by server
+            try:
+                response, data = self._request(body, headers)
+                break
+            except client.RemoteDisconnected:
+                if i:
+                    raise
+            except OSError as e:
+                if i or e.errno not in (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE):
+                    raise
+        self._bytes_sent += len(body)
+        self._bytes_received += len(data)
+        if response.status != 200:
+            raise xmlrpc.client.ProtocolError(self.host + self.path, response.status, response.reason,
+                                              dict(response.getheaders()))
+        if response.getheader("Content-Encoding", "") == "gzip":
+            data = xmlrpc.client.gzip_decode(data, max_decode=-1)
+        result = json.loads(data)
+        if result.get('error'):
+            error = result['error']
+            error_data = error.get('data') or {}
+            message = error_data.get('message') or error.get('message', '')
+            if error_data.get('debug'):
+                message = f"{message}\n{error_data['debug']}"
+            raise xmlrpc.client.Fault(error.get('code', 1), message)
+        return result.get('result')
+
+
+RPC_BACKENDS = {backend.name: backend for backend in (XmlRpcBackend, JsonRpcBackend)}
+
+
+def rpc_backend(cf: Config, allow_none: bool = False) -> RpcBackend:
+    """ Create remote call backend selected by config `protocol` """
+    if cf.protocol not in RPC_BACKENDS:
+        raise ValueError(f"Unknown protocol: {cf.protocol}, supported: {', '.join(RPC_BACKENDS)}")
+    return RPC_BACKENDS[cf.protocol](cf, allow_none=allow_none)
+
+
+_audio_lock = threading.Lock()
+_audio_cache = {}
+_audio_player = None
+
+
+def load_audio(wav_file: str) -> tuple:
+    """ Decode wav file one time, return (sample width, channels, frame rate, frames) """
+    if wav_file not in _audio_cache:
+        with wave.open(resource_path(wav_file), 'rb') as wf:
+            _audio_cache[wav_file] = (wf.getsampwidth(), wf.getnchannels(), wf.getframerate(),
+                                      wf.readframes(wf.getnframes()))
+    return _audio_cache[wav_file]
+
 
 def play_audio(is_error: bool = False):
-    chunk = 1024
-    mp3_file = 'resources/success.wav' if not is_error else 'resources/error.wav'
+    wav_file = 'resources/success.wav' if not is_error else 'resources/error.wav'
+
     def _play_audio():
-        # song = AudioSegment.from_wav(resource_path(mp3_file))
-        # play(song)
-        with wave.open(resource_path(mp3_file), 'rb') as wf:
-            p = pyaudio.PyAudio()
-            stream = p.open(format=p.get_format_from_width(wf.getsampwidth()),
-                            channels=wf.getnchannels(),
-                            rate=wf.getframerate(),
-                            output=True)
-            while len(data := wf.readframes(chunk)):  # Requires Python 3.8+ for :=
-                stream.write(data)
-            stream.close()
-            p.terminate()
+        global _audio_player
+        # one PyAudio handle for the app, sounds are played one after another
+        with _audio_lock:
+            if _audio_player is None:
+                import pyaudio
+                _audio_player = pyaudio.PyAudio()
+            sample_width, channels, rate, frames = load_audio(wav_file)
+            stream = _audio_player.open(format=_audio_player.get_format_from_width(sample_width),
+                                        channels=channels, rate=rate, output=True)
+            try:
+                stream.write(frames)
+            finally:
+                stream.close()
 
     threading.Thread(target=_play_audio, daemon=True).start()
 
 
+SERVER_BUSY_MESSAGE = 'The server is busy right now'
+
+
+class AdaptiveLimit:
+    """
+    Limit of concurrent runs on one server (context manager), the limit is halved when the server reports busy and
+    increased by one after each successful upgrade, up to `max_limit`
+    """
+
+    def __init__(self, max_limit: int = 1):
+        self.max_limit = max(max_limit, 1)
+        self.limit = self.max_limit
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def on_busy(self):
+        with self.condition:
+            self.limit = max(self.limit // 2, 1)
+
+    def on_success(self):
+        with self.condition:
+            if self.limit < self.max_limit:
+                self.limit += 1
+                self.condition.notify_all()
+
+
+_server_limits = {}
+_server_limits_lock = threading.Lock()
+
+
+def server_limit(cf: Config, max_limit: int = None) -> AdaptiveLimit:
+    """ Shared adaptive limit of the server (host of url) of the config, `max_limit` is set by fleet mode """
+    key = urlparse(cf.url).netloc
+    with _server_limits_lock:
+        if key not in _server_limits:
+            _server_limits[key] = AdaptiveLimit(max_limit or 1)
+        elif max_limit:
+            _server_limits[key].max_limit = max(max_limit, 1)
+        return _server_limits[key]
+
+
+def module_versions(backend: RpcBackend, cf: Config, uid: int, names: list) -> dict:
+    """
+    Read state and versions of the modules in one request
+    :return: dict module name -> dict with keys: id, name, state, latest_version, installed_version
+    """
+    records = backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module', 'search_read', [[('name', 'in', names)]],
+                                 {'fields': ['name', 'state', 'latest_version', 'installed_version']})
+    return {rec['name']: rec for rec in records}
+
+
+def is_module_upgraded(version: dict) -> bool:
+    """ Module is installed and its version in database is the version of code (when the version of code is known) """
+    return version.get('state') == 'installed' and \
+        version.get('latest_version') == version.get('installed_version', version.get('latest_version'))
+
+
+def verify_upgrade(backend: RpcBackend, cf: Config, uid: int, names: list, before: dict) -> dict:
+    """
+    Confirm the result of upgrade requests answered by "server is busy": the module is upgraded when the versions read
+    before the upgrade had a new version of code (`before`, see `module_versions`) and now the module is installed
+    with the version in database equal to the version of code. An upgrade of a module without a new version cannot be
+    told apart from no upgrade, it is not verifiable.
+    :return: dict module name -> dict with keys: id, state, latest_version, installed_version, verifiable, upgraded
+    """
+    result = {}
+    for name, rec in module_versions(backend, cf, uid, names).items():
+        old = before.get(name)
+        verifiable = bool(old and old['latest_version'] != old['installed_version'])
+        result[name] = dict(rec, verifiable=verifiable, previous_version=old['latest_version'] if old else '',
+                            upgraded=verifiable and rec['state'] == 'installed'
+                            and rec['latest_version'] == rec['installed_version'])
+    return result
+
+
+PLAN_SIGNS = {'upgrade': '+', 'skip': '=', 'missing': '?'}
+# number of hot spots (functions by own time) of a server profile printed, all top functions are in the report file
+PROFILE_SUMMARY_ROWS = 5
+
+
+def plan_update(backend: RpcBackend, cf: Config, uid: int, names: list, force: bool = False) -> list:
+    """
+    Refresh module list on remote server then read versions of all modules in one request, the module is upgraded only
+    when the version of code (`installed_version`) is different from version in database (`latest_version`)
+    :return: list of dict with keys: id, name, action ('upgrade', 'skip' or 'missing'), state, installed_version,
+        latest_version, in the order of `names`
+    """
+    backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module', 'update_list', [])
+    records = backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module', 'search_read', [[('name', 'in', names)]],
+                                 {'fields': ['name', 'state', 'installed_version', 'latest_version']})
+    found = {rec['name']: rec for rec in records}
+    plan = []
+    for name in names:
+        rec = found.get(name)
+        if not rec:
+            plan.append({'id': None, 'name': name, 'action': 'missing', 'state': None, 'installed_version': None,
+                         'latest_version': None})
+            continue
+        is_changed = rec['state'] != 'installed' or rec['installed_version'] != rec['latest_version']
+        plan.append({'id': rec['id'], 'name': name, 'action': 'upgrade' if force or is_changed else 'skip',
+                     'state': rec['state'], 'installed_version': rec['installed_version'],
+                     'latest_version': rec['latest_version']})
+    return plan
+
+
+def module_dependencies(backend: RpcBackend, cf: Config, uid: int) -> dict:
+    """
+    Read dependency graph of installed modules from remote server
+    :return: dict of module name -> list of names of modules it depends on
+    """
+    modules = backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module', 'search_read',
+                                 [[('state', '=', 'installed')]], {'fields': ['name']})
+    names = {rec['id']: rec['name'] for rec in modules}
+    dependencies = backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module.dependency', 'search_read',
+                                      [[('module_id', 'in', list(names))]], {'fields': ['name', 'module_id']})
+    depends = {name: [] for name in names.values()}
+    for rec in dependencies:
+        if rec['module_id'] and rec['module_id'][0] in names:
+            depends[names[rec['module_id'][0]]].append(rec['name'])
+    return depends
+
+
+def module_dependents(backend: RpcBackend, cf: Config, uid: int, ids: list) -> list:
+    """
+    Read installed modules depend on the modules (directly or indirectly) in one request
+    :param ids: ids of modules
+    :return: ids of the modules and all installed modules depend on them
+    """
+    dependencies = backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module.dependency', 'search_read',
+                                      [[('module_id.state', '=', 'installed')]], {'fields': ['module_id', 'depend_id']})
+    dependents = {}
+    for rec in dependencies:
+        if rec['module_id'] and rec['depend_id']:
+            dependents.setdefault(rec['depend_id'][0], []).append(rec['module_id'][0])
+    result = list(dict.fromkeys(ids))
+    visited = set(result)
+    for mod_id in result:
+        # result grows while iterating: breadth-first walk of dependents
+        for dependent_id in dependents.get(mod_id, []):
+            if dependent_id not in visited:
+                visited.add(dependent_id)
+                result.append(dependent_id)
+    return result
+
+
+def collapse_modules(names: list, depends: dict) -> tuple:
+    """
+    Drop modules which are upgraded by a requested dependency (upgrade a module also upgrades all installed modules
+    depend on it)
+    :param names: module names to upgrade
+    :param depends: dependency graph, see `module_dependencies`
+    :return: tuple (list of module names to upgrade, dict of dropped module name -> the requested dependency it is
+        upgraded with)
+    """
+    ancestors = {}
+
+    def get_ancestors(name: str) -> set:
+        if name not in ancestors:
+            ancestors[name] = set()
+            for dependency in depends.get(name, []):
+                ancestors[name] |= {dependency} | get_ancestors(dependency)
+        return ancestors[name]
+
+    requested = set(names)
+    covered = {}
+    for name in names:
+        covering = [a for a in names if a in get_ancestors(name)]
+        if covering:
+            # pick the requested ancestor which is not covered by another one
+            covered[name] = next((a for a in covering if not get_ancestors(a) & requested), covering[0])
+    # the remaining modules do not depend on each other, keep the request order
+    return [name for name in names if name not in covered], covered
+
+
+class SessionCache:
+    """
+    Cache of uid and server version per (url, db, user) to skip the version / authenticate handshake of repeated runs,
+    the entry is valid for `Config.session_ttl` seconds. The cache is saved in `logs/`, the password (or any hash of it)
+    is not stored: a wrong or changed password is answered "Access denied" by the first request, the entry is
+    invalidated then.
+    """
+
+    def __init__(self, cache_file: str = None):
+        self.cache_file = cache_file or os.path.join(base_dir, 'logs', 'session_cache.json')
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        data = {}
+        if os.path.isfile(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+        self.entries = data.get('entries', {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_file = f"{self.cache_file}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({'entries': self.entries}, f)
+        os.replace(tmp_file, self.cache_file)
+
+    @staticmethod
+    def key(cf: Config) -> str:
+        return f"{cf.url.rstrip('/')}|{cf.db}|{cf.username}"
+
+    def get(self, cf: Config):
+        """ :return: tuple (uid, server version) or None if not cached or expired """
+        if not cf.session_ttl:
+            return None
+        with self.lock:
+            self._load()
+            entry = self.entries.get(self.key(cf))
+        if not entry or time.time() - entry['time'] > cf.session_ttl:
+            return None
+        return entry['uid'], entry['version']
+
+    def set(self, cf: Config, uid: int, version: str):
+        if not cf.session_ttl or not uid:
+            return
+        with self.lock:
+            self._load()
+            now = time.time()
+            self.entries = {key: entry for key, entry in self.entries.items() if now - entry['time'] <= 24 * 3600}
+            self.entries[self.key(cf)] = {'uid': uid, 'version': version, 'time': now}
+            self._save()
+
+    def invalidate(self, cf: Config):
+        with self.lock:
+            self._load()
+            if self.entries.pop(self.key(cf), None):
+                self._save()
+
+
+session_cache = SessionCache()
+
+
+class TimingStore:
+    """
+    History of upgrade run-time per (server, database, module) as exponential moving average, used to estimate the
+    duration of a run. Batch upgrades are stored per database as run-time per module of the batch (key `BATCH`).
+    The store is saved in `logs/timings.json`.
+    """
+    BATCH = '*batch*'
+    alpha = 0.3
+
+    def __init__(self, store_file: str = None):
+        self.store_file = store_file or os.path.join(base_dir, 'logs', 'timings.json')
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def target(cf: Config) -> str:
+        return f"{urlparse(cf.url).netloc}/{cf.db}"
+
+    def load(self) -> dict:
+        if not os.path.isfile(self.store_file):
+            return {}
+        try:
+            with open(self.store_file, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def update(self, cf: Config, timings: dict, batch: tuple = None):
+        """
+        Add run-time of a run to the history
+        :param timings: dict module name -> run-time (seconds) of modules upgraded one by one
+        :param batch: tuple (run-time, number of modules) of the batch upgrade
+        """
+        if batch and batch[1]:
+            timings = dict(timings, **{self.BATCH: batch[0] / batch[1]})
+        if not timings:
+            return
+        with self.lock:
+            # read again before write, other runs (fleet) update the same file
+            store = self.load()
+            history = store.setdefault(self.target(cf), {})
+            for name, run_time in timings.items():
+                item = history.get(name)
+                if item:
+                    item['ema'] = self.alpha * run_time + (1 - self.alpha) * item['ema']
+                    item['count'] += 1
+                else:
+                    item = history[name] = {'ema': run_time, 'count': 1}
+                item['last'] = run_time
+                item['time'] = time.time()
+            os.makedirs(os.path.dirname(self.store_file), exist_ok=True)
+            tmp_file = f"{self.store_file}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(store, f, indent=1)
+            os.replace(tmp_file, self.store_file)
+
+    def estimate(self, cf: Config, names: list, batch: bool = False, store: dict = None) -> tuple:
+        """
+        Estimate run-time of upgrade of the modules, a module without history is estimated by the average of the known
+        modules of the database (or of all databases)
+        :return: tuple (seconds, number of modules with history)
+        """
+        store = self.load() if store is None else store
+        history = store.get(self.target(cf), {})
+        known = [history[name]['ema'] for name in names if name in history]
+        if batch and self.BATCH in history:
+            return history[self.BATCH]['ema'] * len(names), len(known)
+        averages = [item['ema'] for name, item in history.items() if name != self.BATCH]
+        if not averages:
+            averages = [item['ema'] for target in store.values() for name, item in target.items() if name != self.BATCH]
+        default = sum(averages) / len(averages) if averages else 0.0
+        return sum(known) + default * (len(names) - len(known)), len(known)
+
+
+timing_store = TimingStore()
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def language_code(language: str) -> str:
+    """ Language code from GUI option "vi_VN (Vietnamese)" or config "vi_VN" """
+    return language.strip().split(" ")[0]
+
+
+def language_codes(languages) -> list:
+    """ Language codes from config "vi_VN", "vi_VN,fr_FR" or ["vi_VN", "fr_FR"], or GUI options, without duplicates """
+    if isinstance(languages, str):
+        languages = languages.split(",")
+    return list(dict.fromkeys(code for code in map(language_code, languages or []) if code))
+
+
+def preflight(cf: Config) -> dict:
+    """
+    Check the target before any upgrade: the server is reachable, the login is accepted, all requested modules are
+    installed and the languages are active, modules are checked by one query. The uid and version are cached for the
+    run.
+    :return: dict with keys: ok, errors (list of text), version, uid, duration
+    """
+    start_time = time.time()
+    result = {'ok': False, 'errors': [], 'version': None, 'uid': None, 'duration': 0.0}
+    backend = rpc_backend(cf)
+    try:
+        cached = session_cache.get(cf)
+        if cached:
+            uid, version = cached
+        else:
+            version = backend.version()['server_version']
+            uid = backend.authenticate(cf.db, cf.username, cf.password, {})
+        result['version'] = version
+        if not uid:
+            result['errors'].append(f"Access denied for user '{cf.username}' on database '{cf.db}'")
+            return result
+        result['uid'] = uid
+        names = [name.strip() for name in cf.modules_to_update if name.strip()]
+        if names:
+            modules = {rec['name']: rec['state'] for rec in backend.execute_kw(
+                cf.db, uid, cf.password, 'ir.module.module', 'search_read', [[('name', 'in', names)]],
+                {'fields': ['name', 'state']})}
+            missing = [name for name in names if name not in modules]
+            if missing:
+                result['errors'].append(f"Module(s) not found: {', '.join(missing)}")
+            not_installed = [f"{name} ({modules[name]})" for name in names if modules.get(name, 'installed') != 'installed']
+            if not_installed:
+                result['errors'].append(f"Module(s) not installed: {', '.join(not_installed)}")
+        codes = language_codes(cf.language_to_update)
+        if codes:
+            languages = {rec['code']: rec['active'] for rec in backend.execute_kw(
+                cf.db, uid, cf.password, 'res.lang', 'search_read', [[('code', 'in', codes)]],
+                {'fields': ['code', 'active'], 'context': {'active_test': False}})}
+            missing = [code for code in codes if code not in languages]
+            if missing:
+                result['errors'].append(f"Language(s) not found: {', '.join(missing)}")
+            inactive = [code for code in codes if languages.get(code) is False]
+            if inactive:
+                result['errors'].append(f"Language(s) not active: {', '.join(inactive)}")
+        # the login is confirmed by the queries above, a wrong password raises "Access denied"
+        session_cache.set(cf, uid, version)
+    except xmlrpc.client.Fault as e:
+        if 'access denied' in str(e).lower():
+            session_cache.invalidate(cf)
+            result['errors'].append(f"Access denied for user '{cf.username}' on database '{cf.db}'")
+        else:
+            result['errors'].append(f"Server error: {str(e).strip().splitlines()[-1] if str(e).strip() else e}")
+    except (OSError, xmlrpc.client.ProtocolError) as e:
+        result['errors'].append(f"Cannot connect to {cf.url}: {e}")
+    finally:
+        result['duration'] = time.time() - start_time
+    result['ok'] = not result['errors']
+    return result
+
+
+def preflight_targets(targets: list, workers: int = 4) -> list:
+    """
+    Run pre-flight checks of targets in parallel and print the report
+    :param targets: list of tuple (target name, Config)
+    :return: list of results of `preflight`, same order as targets
+    """
+    print(f"Pre-flight check: {len(targets)} target(s)...")
+
+    def check(cf: Config) -> dict:
+        try:
+            return preflight(cf)
+        except Exception as e:
+            return {'ok': False, 'errors': [f"{type(e).__name__}: {e}"], 'version': None, 'uid': None, 'duration': 0.0}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = list(executor.map(check, [cf for _, cf in targets]))
+    for (name, cf), result in zip(targets, results):
+        status = "OK" if result['ok'] else "FAILED"
+        if color_allow:
+            status = colored(f"{status:<6}", 'green' if result['ok'] else 'red')
+        else:
+            status = f"{status:<6}"
+        print(f"  {status} {result['duration']:>7.2f}s  {name}  ({cf.url}, {cf.db}, version: {result['version'] or 'n/a'})")
+        for error in result['errors']:
+            print(f"           - {error}")
+    return results
+
+
+class RunMetrics:
+    """ Timing of phases and remote calls of one run, exported to JSON lines file and Prometheus textfile """
+
+    def __init__(self, cf: Config):
+        self.cf = cf
+        self.run_id = uuid.uuid4().hex
+        self.start_time = time.time()
+        self.end_time = None
+        self.is_ok = False
+        self.phases = []
+        self.rpcs = []
+        self.module_loads = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **labels):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start_time, **labels)
+
+    def add_phase(self, name: str, start_time: float, duration: float = None, **labels):
+        duration = time.time() - start_time if duration is None else duration
+        self.phases.append(dict(phase=name, start=start_time, duration=duration, **labels))
+
+    def add_rpc(self, service: str, model: str, method: str, start_time: float, bytes_sent: int = 0,
+                bytes_received: int = 0, error: str = None):
+        self.rpcs.append({'service': service, 'model': model, 'method': method, 'start': start_time,
+                          'duration': time.time() - start_time, 'bytes_sent': bytes_sent,
+                          'bytes_received': bytes_received, 'error': error})
+
+    def add_module_load(self, name: str, info: dict):
+        """ Load time of a module reported by the server (patch function `remote_upgrade_modules`) """
+        self.module_loads.append({'module': name, 'duration': info['duration'], 'records': info['records'],
+                                  'queries': info.get('queries', 0), 'data_files': info['data_files'],
+                                  'errors': len(info['errors'])})
+
+    def finish(self, is_ok: bool):
+        self.end_time = time.time()
+        self.is_ok = bool(is_ok)
+
+    def summary(self) -> dict:
+        return {
+            'type': 'run', 'run_id': self.run_id, 'url': self.cf.url, 'db': self.cf.db,
+            'config': os.path.basename(self.cf.config_file), 'start': self.start_time, 'end': self.end_time,
+            'duration': (self.end_time or time.time()) - self.start_time, 'result': self.is_ok,
+            'rpc_calls': len(self.rpcs), 'rpc_time': sum(rpc['duration'] for rpc in self.rpcs),
+            'bytes_sent': sum(rpc['bytes_sent'] for rpc in self.rpcs),
+            'bytes_received': sum(rpc['bytes_received'] for rpc in self.rpcs),
+            'phases': {phase: sum(p['duration'] for p in self.phases if p['phase'] == phase)
+                       for phase in dict.fromkeys(p['phase'] for p in self.phases)},
+        }
+
+    def export_jsonl(self, metrics_dir: str = None) -> str:
+        """ Write one JSON line per phase and per remote call then the run summary to a new file """
+        metrics_dir = metrics_dir or os.path.join(base_dir, 'logs', 'metrics')
+        os.makedirs(metrics_dir, exist_ok=True)
+        config_name = os.path.basename(self.cf.config_file).replace('.json', '') or 'run'
+        file_name = f"{config_name}_{self.cf.db}_{datetime.datetime.fromtimestamp(self.start_time):%Y%m%d_%H%M%S}_{self.run_id[:8]}.jsonl"
+        metrics_file = os.path.join(metrics_dir, file_name)
+        with open(metrics_file, 'w') as f:
+            for item in self.phases:
+                f.write(json.dumps(dict(item, type='phase', run_id=self.run_id)) + "\n")
+            for item in self.rpcs:
+                f.write(json.dumps(dict(item, type='rpc', run_id=self.run_id)) + "\n")
+            for item in self.module_loads:
+                f.write(json.dumps(dict(item, type='module_load', run_id=self.run_id)) + "\n")
+            f.write(json.dumps(self.summary()) + "\n")
+        return metrics_file
+
+    def export_prometheus(self, prometheus_dir: str) -> str:
+        """ Write metrics of the run to a textfile of node exporter textfile collector, one file per config / db """
+        summary = self.summary()
+
+        def label_value(value) -> str:
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        labels = f'url="{label_value(self.cf.url)}",db="{label_value(self.cf.db)}",config="{label_value(summary["config"])}"'
+        lines = []
+
+        def add_metric(name: str, help_text: str, values: list):
+            lines.append(f"# HELP odoo_remote_update_{name} {help_text}")
+            lines.append(f"# TYPE odoo_remote_update_{name} gauge")
+            for extra_labels, value in values:
+                lines.append(f"odoo_remote_update_{name}{{{labels}{extra_labels}}} {value}")
+
+        add_metric('last_run_timestamp_seconds', "Start time of the last run", [('', summary['start'])])
+        add_metric('run_seconds', "Duration of the last run", [('', round(summary['duration'], 3))])
+        add_metric('success', "1 if the last run is successful", [('', int(summary['result']))])
+        add_metric('phase_seconds', "Duration of each phase in the last run",
+                   [(f',phase="{label_value(phase)}"', round(duration, 3)) for phase, duration in summary['phases'].items()])
+        add_metric('rpc_calls', "Number of remote calls in the last run", [('', summary['rpc_calls'])])
+        add_metric('rpc_seconds', "Sum of remote call duration in the last run", [('', round(summary['rpc_time'], 3))])
+        add_metric('bytes_sent', "Bytes sent to server in the last run", [('', summary['bytes_sent'])])
+        add_metric('bytes_received', "Bytes received from server in the last run", [('', summary['bytes_received'])])
+        os.makedirs(prometheus_dir, exist_ok=True)
+        config_name = summary['config'].replace('.json', '') or 'run'
+        prom_file = os.path.join(prometheus_dir, f"odoo_remote_update_{config_name}_{self.cf.db}.prom")
+        # write to temp file then rename, node exporter never reads a partial file
+        with open(prom_file + '.tmp', 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(prom_file + '.tmp', prom_file)
+        return prom_file
+
+
+class RunJournal:
+    """
+    Append-only journal of runs of one config / database: start and end of each run and each module upgrade, one JSON
+    line per event. The file is rotated when it is larger than `max_bytes`, `backups` rotated files are kept.
+    """
+    max_bytes = 1024 * 1024
+    backups = 3
+    # resume ignores modules upgraded earlier than this (seconds)
+    resume_max_age = 24 * 3600
+    _lock = threading.Lock()
+
+    def __init__(self, cf: Config, run_id: str, journal_dir: str = None):
+        self.cf = cf
+        self.run_id = run_id
+        journal_dir = journal_dir or os.path.join(base_dir, 'logs', 'journal')
+        config_name = os.path.basename(cf.config_file).replace('.json', '') or 'run'
+        self.journal_file = os.path.join(journal_dir, f"{config_name}_{cf.db}.jsonl")
+        # results of this run: module name -> last result, translation result (None if not run)
+        self.results = {}
+        self.translation = None
+
+    def files(self) -> list:
+        """ Journal files, oldest first """
+        rotated = [f"{self.journal_file}.{i}" for i in range(self.backups, 0, -1)]
+        return [file for file in rotated + [self.journal_file] if os.path.isfile(file)]
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.isfile(f"{self.journal_file}.{i}"):
+                os.replace(f"{self.journal_file}.{i}", f"{self.journal_file}.{i + 1}")
+        os.replace(self.journal_file, f"{self.journal_file}.1")
+
+    def write(self, event: str, **values):
+        entry = dict(event=event, run_id=self.run_id, time=time.time(), **values)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+            if os.path.isfile(self.journal_file) and os.path.getsize(self.journal_file) >= self.max_bytes:
+                self._rotate()
+            with open(self.journal_file, 'a') as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    def run_start(self, modules: list):
+        self.write('run_start', url=self.cf.url, db=self.cf.db, modules=modules)
+
+    def run_end(self, is_ok: bool):
+        self.write('run_end', result=bool(is_ok))
+
+    def module_start(self, name: str):
+        self.write('module_start', module=name)
+
+    def module_end(self, name: str, result: str, duration: float = None, **values):
+        """
+        :param result: 'ok', 'failed', 'busy' (followed by the verified result), 'not_found', 'not_installed',
+        'cancelled', 'covered' (upgraded with a requested dependency), 'skipped' (unchanged, skipped by the plan) or
+        'resumed' (upgraded by the previous run)
+        """
+        self.results[name] = result
+        self.write('module_end', module=name, result=result, duration=duration, **values)
+
+    def translation_end(self, is_ok: bool, languages: list):
+        self.translation = bool(is_ok)
+        self.write('translation_end', result=self.translation, languages=languages)
+
+    def entries(self):
+        for file in self.files():
+            with open(file, 'r') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # partial line of an interrupted write
+                        continue
+
+    def upgraded_modules(self) -> dict:
+        """
+        Modules upgraded successfully on the server of the config since the last successful run and not older than
+        `resume_max_age`, the runs after the last successful run are interrupted or failed
+        :return: dict module name -> time of upgrade
+        """
+        upgraded = {}
+        url = None
+        min_time = time.time() - self.resume_max_age
+        for entry in self.entries():
+            if entry.get('run_id') == self.run_id:
+                continue
+            if entry['event'] == 'run_start':
+                url = entry.get('url')
+            elif entry['event'] == 'run_end' and entry.get('result'):
+                upgraded = {}
+            elif entry['event'] == 'module_end' and entry.get('result') in ('ok', 'covered'):
+                if url == self.cf.url and entry['time'] >= min_time:
+                    upgraded[entry['module']] = entry['time']
+        return upgraded
+
+
+def remote_patch_features(backend: RpcBackend, cf: Config, uid: int) -> list:
+    """ Functions supported by the patch `patch_odoo/ir_module_module.py` on remote server, empty if not patched """
+    try:
+        return backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module', 'remote_patch_info', [])['features']
+    except xmlrpc.client.Fault:
+        return []
+
+
+def run_upgrade_job(backend: RpcBackend, cf: Config, uid: int, ids: list, output: callable, results: dict = None):
+    """
+    Start upgrade job of modules on remote server (patch function `remote_upgrade_start`), then poll its status until
+    the job is done, the progress is reported to `output`. Polling stops when the job makes no progress (module
+    loaded) for `read_timeout` seconds or the server reports the job lost (its process is gone).
+    :param results: filled with the state and versions of each module read by the server after the upgrade, module
+        name -> dict with keys: state, latest_version, installed_version (not set by an older patch)
+    :return: response of `button_immediate_upgrade` on remote server
+    :raise xmlrpc.client.Fault: the upgrade job failed
+    """
+    job_id = backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module', 'remote_upgrade_start', [ids])['job_id']
+    output("    - Upgrade job: ", sep="")
+    output(job_id, font="Consolas 9")
+    last_progress = None
+    last_progress_time = time.time()
+    errors = 0
+    while True:
+        if time.time() - last_progress_time > cf.read_timeout:
+            raise xmlrpc.client.Fault(1, f"Upgrade job {job_id}: no progress for {cf.read_timeout:.0f} seconds, the job "
+                                         f"may still run on the server")
+        time.sleep(cf.poll_interval)
+        try:
+            job = backend.execute_kw(cf.db, uid, cf.password, 'ir.module.module', 'remote_upgrade_status', [job_id])
+            errors = 0
+        except (OSError, xmlrpc.client.ProtocolError):
+            # the job is still running on server, retry polling on network error
+            errors += 1
+            if errors >= 5:
+                raise
+            continue
+        if job['state'] == 'running':
+            if job['current'] and (job['loaded'], job['current']) != last_progress:
+                last_progress, last_progress_time = (job['loaded'], job['current']), time.time()
+                output(f"    - [{job['loaded']}/{job['total']}] loading module: {job['current']} "
+                       f"({job['elapsed']:.0f} seconds)", font="Consolas 9")
+        elif job['state'] == 'done':
+            if results is not None:
+                results.update(job.get('results') or {})
+            return job['result']
+        else:
+            raise xmlrpc.client.Fault(1, job.get('traceback') or job.get('error') or f"Upgrade job {job_id}: {job['state']}")
+
+
+def translation_checkpoint_file(cf: Config, code: str) -> str:
+    config_name = os.path.basename(cf.config_file) if cf.config_file else os.path.basename(sys.argv[1])
+    return os.path.join(base_dir, 'logs', 'checkpoints', f"{config_name.replace('.json', '')}_{cf.db}_{code}_translation.json")
+
+
+def load_translation_checkpoint(cf: Config, code: str, mods: list) -> list:
+    """
+    Read ids of modules which translation is updated by a previous interrupted run, the checkpoint is ignored after
+    one day
+    :param mods: ids of modules to update translation of this run
+    """
+    checkpoint_file = translation_checkpoint_file(cf, code)
+    if not os.path.isfile(checkpoint_file) or time.time() - os.path.getmtime(checkpoint_file) > 24 * 3600:
+        return []
+    try:
+        with open(checkpoint_file, 'r') as f:
+            checkpoint = json.load(f)
+    except ValueError:
+        return []
+    if checkpoint.get('url') != cf.url:
+        return []
+    done = set(checkpoint.get('done', []))
+    return [mod_id for mod_id in mods if mod_id in done]
+
+
+def save_translation_checkpoint(cf: Config, code: str, done: list):
+    checkpoint_file = translation_checkpoint_file(cf, code)
+    os.makedirs(os.path.dirname(checkpoint_file), exist_ok=True)
+    with open(checkpoint_file + '.tmp', 'w') as f:
+        json.dump({'url': cf.url, 'db': cf.db, 'lang': code, 'done': done}, f)
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+
+def clear_translation_checkpoint(cf: Config, code: str):
+    checkpoint_file = translation_checkpoint_file(cf, code)
+    if os.path.isfile(checkpoint_file):
+        os.remove(checkpoint_file)
+
+
+def update_translation_chunk(backend: RpcBackend, cf: Config, uid: int, chunk: list, langs: list, kwargs: dict,
+                             use_patch: bool = True):
+    """
+    Update translation of the modules of one chunk for the languages
+    :param kwargs: params of patch function `remote_update_translation`
+    :param use_patch: odoo from version 11.0 requires the patch to call internal function `_update_translations`
+    :return: (response of the server, error text if the native function failed)
+    """
+    # old patch and native function accept one language code
+    filter_lang = langs if len(langs) > 1 else langs[0]
+    if use_patch:
+        return backend.execute_kw(cf.db, uid, cf.password, "ir.module.module", "remote_update_translation", [chunk],
+                                  dict(kwargs, filter_lang=filter_lang)), ""
+    # using native function of odoo, response nothing
+    try:
+        backend.execute_kw(cf.db, uid, cf.password, "ir.module.module", "update_translations", [chunk],
+                           {'filter_lang': filter_lang, 'context': {'overwrite': True}})
+        # backend allow None response (JSON-RPC)
+        return True, ""
+    except Exception as e:
+        if "cannot marshal None unless allow_none is enabled" in e.__str__():
+            return True, ""
+        return False, e.__str__()
+
+
+def update_translation_pass(backend: RpcBackend, cf: Config, uid: int, langs: list, mods: list, kwargs: dict,
+                            output: callable, use_patch: bool = True, upgraded: list = None,
+                            cancel_event: threading.Event = None) -> dict:
+    """
+    Update translation of the modules in chunks for the languages, the finished chunks are saved to the checkpoint of
+    the languages, it is resumed by the next run with resume
+    :param upgraded: ids of modules upgraded by this run, their translation is updated even if done by an
+        interrupted run
+    :return: dict with keys: ok, cancelled (optional), languages (result of each language of the pass: duration,
+        loaded, skipped, saved), log (error text), profiles (profile of each chunk)
+    """
+    start_time = time.time()
+    checkpoint_key = "+".join(langs)
+    # the checkpoint of an interrupted run is used only when resume is requested
+    done = load_translation_checkpoint(cf, checkpoint_key, mods) if cf.resume else []
+    if done and upgraded:
+        refreshed = set(module_dependents(backend, cf, uid, upgraded))
+        done = [mod_id for mod_id in done if mod_id not in refreshed]
+    if done:
+        output("  - Resume from checkpoint: ", sep="")
+        output(str(len(done)), font="arial 9 bold", sep="")
+        output(" module(s) updated before")
+    loaded, skipped, saved_time = 0, [], 0.0
+    languages, log_text, profiles = {}, "", []
+    pending = [mod_id for mod_id in mods if mod_id not in done]
+    chunk_size = cf.translation_chunk_size or len(pending) or 1
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    result = True
+    for index, chunk in enumerate(chunks, 1):
+        if cancel_event is not None and cancel_event.is_set():
+            output("  - Update ", sep="")
+            output("cancelled", text_color="red", sep="")
+            output(", the finished chunks are resumed by the next run with resume")
+            return {'ok': False, 'cancelled': True, 'languages': {}, 'log': log_text, 'profiles': profiles}
+        chunk_start = time.time()
+        result, error = update_translation_chunk(backend, cf, uid, chunk, langs, kwargs, use_patch)
+        if error:
+            log_text = log_text + f"\nError report:\n{error}" if log_text else error
+        if result is not True and not (type(result) is dict and result.get('status')):
+            break
+        done += chunk
+        save_translation_checkpoint(cf, checkpoint_key, done)
+        if type(result) is dict and result.get('profile'):
+            profiles.append(result['profile'])
+        if type(result) is dict and 'skipped' in result:
+            loaded += len(result['loaded'])
+            skipped += result['skipped']
+            saved_time += result['saved']
+        for lang, lang_result in (result.get('languages') or {}).items() if type(result) is dict else []:
+            total = languages.setdefault(lang, {'duration': 0.0, 'loaded': 0, 'skipped': 0, 'saved': 0.0})
+            total['duration'] += lang_result['duration']
+            total['loaded'] += len(lang_result['loaded'])
+            total['skipped'] += len(lang_result['skipped'])
+            total['saved'] += lang_result['saved']
+        if len(chunks) > 1:
+            chunk_time = time.time() - chunk_start
+            output(f"  - Chunk [{index}/{len(chunks)}]: {len(chunk)} module(s), {chunk_time:.2f} seconds"
+                   + (f" (server: {result['duration']:.2f})" if type(result) is dict and 'duration' in result else "")
+                   + f", {len(chunk) / max(chunk_time, 0.001):.2f} module(s)/second"
+                   + (f", {len(result['skipped'])} unchanged" if type(result) is dict and 'skipped' in result else ""),
+                   font="Consolas 9")
+    else:
+        clear_translation_checkpoint(cf, checkpoint_key)
+
+    is_ok = False
+    if type(result) is dict and 'status' in result:
+        if result['status']:
+            output("  - Update ", sep="")
+            output("success", text_color="green")
+            output("  - Duration: ", sep="")
+            output(f"{int(time.time() - start_time)}", font="arial 9 bold", sep="")
+            output(" second(s)")
+            if 'skipped' in result:
+                output(f"  - Loaded: {loaded} module(s), skipped (translation files unchanged): ", sep="")
+                output(str(len(skipped)), font="arial 9 bold", sep="")
+                output(f" module(s), time saved: ~{format_duration(saved_time)}" if skipped else " module(s)")
+            is_ok = True
+        else:
+            log_text += f"Update error logs:\n{result['error']}"
+            output("  - Update ", sep="")
+            output("failed", text_color="red")
+            output("  - Error message: ", sep="")
+            output(result['error'], font="Consolas 9")
+    elif type(result) is bool:
+        if result:
+            output("  - Update ", sep="")
+            output("success", text_color="green")
+            output("  - Duration: ", sep="")
+            output(f"{int(time.time() - start_time)}", font="arial 9 bold", sep="")
+            output(" second(s)")
+            is_ok = True
+        else:
+            output("  - Update ", sep="")
+            output("failed", text_color="red", sep="")
+            output(". Please check server logs.")
+    else:
+        output("  - Unknown response: ", sep="")
+        output(str(result), font="Consolas 9")
+    if len(langs) == 1 and not languages:
+        # old patch or native function: the pass time is the time of the language
+        languages[langs[0]] = {'duration': time.time() - start_time, 'loaded': loaded, 'skipped': len(skipped),
+                               'saved': saved_time}
+    return {'ok': is_ok, 'languages': languages, 'log': log_text, 'profiles': profiles}
+
+
+def update_translations(backend: RpcBackend, cf: Config, uid: int, codes: list, mods: list, features: list,
+                        output: callable, use_patch: bool = True, upgraded: list = None,
+                        cancel_event: threading.Event = None, output_profile: callable = None) -> dict:
+    """
+    Update translation of the modules for the active languages: one pass for all languages when the patched server
+    loads all languages of a module in one visit (feature `translation_languages`), else one pass per language
+    :param features: features of the patch on the server, see `remote_patch_features`
+    :param upgraded: ids of modules upgraded by this run, see `update_translation_pass`
+    :param output_profile: function to output the profiles of a pass (opt-in profile)
+    :return: dict with keys: ok, log (error text), languages (dict code -> status: True, False or None if not
+        updated, duration, loaded, skipped, saved)
+    """
+    languages = {code: {'status': None, 'duration': 0.0, 'loaded': 0, 'skipped': 0, 'saved': 0.0} for code in codes}
+    if 'translation_languages' in features and len(codes) > 1:
+        passes = [codes]
+        output("  - All languages of a module are loaded in one visit")
+    else:
+        passes = [[code] for code in codes]
+    # patched server skips modules with unchanged translation files, unless force
+    kwargs = {'context': {'overwrite': True}}
+    if 'translation_checksum' in features:
+        kwargs['force'] = cf.translation_force
+    if cf.profile and 'profile' in features:
+        kwargs.update(profile=True, profile_top=cf.profile_top, profile_file=cf.profile_file)
+    is_ok, log_text = True, ""
+    try:
+        for langs in passes:
+            if cancel_event is not None and cancel_event.is_set():
+                output("  - Update ", sep="")
+                output("cancelled", text_color="red", sep="")
+                output(f" before language(s): {', '.join(langs)}")
+                is_ok = False
+                break
+            if len(passes) > 1:
+                output("  - Language: ", sep="")
+                output(langs[0], font="arial 9 bold")
+            result = update_translation_pass(backend, cf, uid, langs, mods, kwargs, output, use_patch, upgraded,
+                                             cancel_event)
+            log_text += result['log']
+            if result['profiles'] and callable(output_profile):
+                output_profile('translation', result['profiles'])
+            if not result.get('cancelled'):
+                for lang in langs:
+                    languages[lang].update(result['languages'].get(lang, {}), status=result['ok'])
+            is_ok = is_ok and result['ok']
+    except xmlrpc.client.Fault as e:
+        log_text = log_text + f"\nXMLRPC error:\n{e.__str__()}" if log_text else e.__str__()
+        is_ok = False
+    if len(codes) > 1:
+        output("  - Result per language:")
+        for code, result in languages.items():
+            output(f"    - {code}: ", sep="")
+            if result['status'] is None:
+                output("not updated", text_color="orange")
+                continue
+            output("success" if result['status'] else "failed", text_color="green" if result['status'] else "red", sep="")
+            output(f", {format_duration(result['duration'])}"
+                   + (f", loaded: {result['loaded']}, skipped: {result['skipped']} module(s)"
+                      if result['loaded'] or result['skipped'] else ""))
+    return {'ok': is_ok and not log_text, 'log': log_text, 'languages': languages}
+
+
 def log_to_file(log_text: str, suffix="_execute_log_", config_file: str = ""):
     log_dir = os.path.join(base_dir, 'logs')
     config_name = os.path.basename(config_file) if config_file else os.path.basename(sys.argv[1])
-    if not os.path.isdir(log_dir):
-        os.mkdir(log_dir)
-    log_file = os.path.join(log_dir, config_name.replace('.json', '') + suffix + str(int(time.time())) + '.txt')
-    with open(log_file, 'w+', errors='ignore') as f_log:
+    os.makedirs(log_dir, exist_ok=True)
+    # unique suffix, many runs (fleet) can write a log in the same second
+    log_file = os.path.join(log_dir, config_name.replace('.json', '') + suffix + str(int(time.time())) + '_'
+                            + uuid.uuid4().hex[:8] + '.txt')
+    with open(log_file, 'x', errors='ignore') as f_log:
         f_log.write(log_text.replace('\\\\n', "\n").replace('\\n', "\n"))
     return log_file
 
 
-def run_update(cf: Config, output_handler: callable = None, is_gui: bool = False):
+def merge_profiles(profiles: list, top: int = 20) -> dict:
+    """ Sum of profile reports of the server (ex: one per translation chunk), top functions are merged by name """
+    merged = {'duration': 0.0, 'queries': 0, 'total_calls': 0, 'functions': [], 'cumulative': []}
+    rows = {'functions': {}, 'cumulative': {}}
+    for profile in profiles:
+        for key in ('duration', 'queries', 'total_calls'):
+            merged[key] += profile[key]
+        for key, by_name in rows.items():
+            for row in profile[key]:
+                total = by_name.setdefault(row['function'], dict(row, calls=0, tottime=0.0, cumtime=0.0))
+                for value in ('calls', 'tottime', 'cumtime'):
+                    total[value] += row[value]
+    merged['functions'] = sorted(rows['functions'].values(), key=lambda row: -row['tottime'])[:top]
+    merged['cumulative'] = sorted(rows['cumulative'].values(), key=lambda row: -row['cumtime'])[:top]
+    return merged
+
+
+def save_profile_report(cf: Config, kind: str, profiles: list) -> str:
+    """
+    Save profile reports of the server to a JSON file in `logs/profiles/`, the full profiles are saved to .prof files
+    next to it (open by `python -m pstats <file>` or snakeviz)
+    :param kind: upgrade or translation
+    :return: path of the report file
+    """
+    profile_dir = os.path.join(base_dir, 'logs', 'profiles')
+    os.makedirs(profile_dir, exist_ok=True)
+    config_name = os.path.basename(cf.config_file).replace('.json', '') or 'run'
+    name = f"{config_name}_{cf.db}_{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}_{kind}"
+    profiles = [dict(profile) for profile in profiles]
+    for index, profile in enumerate(profiles, 1):
+        data = profile.pop('profile_data', '')
+        if data:
+            profile['profile_file'] = os.path.join(profile_dir, f"{name}_{index}.prof" if len(profiles) > 1 else f"{name}.prof")
+            with open(profile['profile_file'], 'wb') as f:
+                f.write(base64.b64decode(data))
+    report_file = os.path.join(profile_dir, f"{name}.json")
+    with open(report_file, 'w') as f:
+        json.dump({'url': cf.url, 'db': cf.db, 'kind': kind, 'summary': merge_profiles(profiles, cf.profile_top),
+                   'profiles': profiles}, f, indent=2)
+    return report_file
+
+
+def run_update(cf: Config, output_handler: callable = None, is_gui: bool = False, interactive: bool = True,
+               cancel_event: threading.Event = None, report: dict = None):
+    """
+    Run module update and translation update of the config
+    :param output_handler: function to output messages, print to console if not set
+    :param is_gui: run from GUI
+    :param interactive: ask to confirm before update (console)
+    :param cancel_event: when it is set, the run stops before the next module (or translation chunk)
+    :param report: filled with the result of each module ('modules', see `RunJournal.module_end`) and of the
+    translation ('translation', None if not run)
+    :return: True if all updates are successful
+    """
+    metrics = RunMetrics(cf)
+    journal = RunJournal(cf, metrics.run_id)
+    journal.run_start(cf.modules_to_update)
+    is_ok = False
+    try:
+        is_ok = _run_update(cf, metrics, journal, output_handler, is_gui, interactive, cancel_event)
+        return is_ok
+    finally:
+        metrics.finish(is_ok)
+        journal.run_end(is_ok)
+        if report is not None:
+            report.update(modules=dict(journal.results), translation=journal.translation)
+        if cf.metrics or cf.prometheus_dir:
+            metrics_files = [metrics.export_jsonl()] if cf.metrics else []
+            if cf.prometheus_dir:
+                metrics_files.append(metrics.export_prometheus(cf.prometheus_dir))
+            for metrics_file in metrics_files:
+                if not callable(output_handler):
+                    print(f"- Metrics file: {metrics_file}")
+                else:
+                    output_handler(f"- Metrics file: {metrics_file}", sep="\n", font="Consolas 9", text_color=None)
+
+
+def _run_update(cf: Config, metrics: RunMetrics, journal: RunJournal, output_handler: callable = None,
+                is_gui: bool = False, interactive: bool = True, cancel_event: threading.Event = None):
     global color_allow
     if is_gui:
         color_allow = False
 
+    def is_cancelled() -> bool:
+        return cancel_event is not None and cancel_event.is_set()
+
     def output(msg: str, sep="\n", font: str = None, text_color: str = None):
         if not callable(output_handler):
             print(msg, sep=sep)
         else:
             output_handler(msg, sep=sep, font=font, text_color=text_color)
 
-    # ref: https://stackoverflow.com/a/2426293/2533787
-    class TimeoutTransport(Transport):
-        timeout = 10.0
-
-        def set_timeout(self, timeout):
-            self.timeout = timeout
-
-        def make_connection(self, host):
-            h = client.HTTPConnection(host, timeout=self.timeout)
-            return h
-
     def xlmrpc_login(allow_none=False):
-        common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(cf.url), transport=t)
-        _version = common.version()['server_version']
+        backend = rpc_backend(cf, allow_none=allow_none)
+        backend.metrics = metrics
+        cached = session_cache.get(cf)
+        if cached:
+            _uid, _version = cached
+        else:
+            with metrics.phase('connect'):
+                _version = backend.version()['server_version']
+        server_version = _version
         if "." in _version:
             _version = _version.split(".")[0]
         if str.isnumeric(_version):
             _version = int(_version)
         try:
-            _uid = common.authenticate(cf.db, cf.username, cf.password, {})
-            output("connected!", text_color="green")
+            if not cached:
+                with metrics.phase('authenticate'):
+                    _uid = backend.authenticate(cf.db, cf.username, cf.password, {})
+                session_cache.set(cf, _uid, server_version)
+            output("connected!" if not cached else "connected! (cached session)", text_color="green")
             output("- Remote server version: ", sep="")
             output(_version, font="arial 9 bold")
         except ConnectionRefusedError as e:
             output("error!\n" + str(e))
             return
-        _models = xmlrpc.client.ServerProxy(f'{cf.url}/xmlrpc/2/object', allow_none=allow_none)
-        return _models, _uid, _version
+        return backend, _uid, _version
+
+    def output_fault(e: xmlrpc.client.Fault):
+        if 'access denied' in str(e).lower():
+            session_cache.invalidate(cf)
+        if 'Access denied' in str(e):
+            output("- ", sep="")
+            output("'Access denied'", font="arial 9 bold", sep="")
+            output(" please check user account and login password!")
+        else:
+            output("- ", sep="")
+            output("Error: ", font="arial 9 bold", sep="")
+            output(str(e), font="Consolas 9")
+
+    def output_module(index: int, tech_name: str):
+        output(f"- [{index}/{total_update}] Update module ", sep="")
+        output(tech_name, font='arial 9 bold', sep="")
+        output(" --- ", sep="")
+
+    def is_upgrade_success(result) -> bool:
+        # success, server response: client reload or redirect to home page
+        return type(result) is dict and (('tag' in result and result['tag'] == 'reload') or ('url' in result and result['url'] == '/web'))
 
     output("- ERP server: ", sep="")
     output(cf.url, font="Consolas 9", text_color="green")
@@ -136,87 +1536,458 @@ def run_update(cf: Config, output_handler: callable = None, is_gui: bool = False
         output(f"- Time now: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     output("- Connecting remote server...", sep=" ")
-    t = TimeoutTransport()
-    t.set_timeout(15 * 60)
     models, uid, remote_odoo_version = xlmrpc_login()
     model_name = 'ir.module.module'
     update_method = 'button_immediate_upgrade'
-    total_update = len(cf.modules_to_update)
+    patch_features = remote_patch_features(models, cf, uid) if cf.modules_to_update or cf.language_to_update else []
+    use_async = False
+    if cf.async_upgrade:
+        use_async = 'remote_upgrade_start' in patch_features
+        if not use_async:
+            output("- Warning: ", font="arial 9 bold", sep="")
+            output("remote server is not patched for upgrade job, the upgrade request waits until it is done")
+    # opt-in profile of the upgrade and translation load by the patched server
+    profile_kwargs = {}
+    if cf.profile and 'profile' in patch_features:
+        profile_kwargs = {'profile': True, 'profile_top': cf.profile_top, 'profile_file': cf.profile_file}
+        if use_async:
+            use_async = False
+            output("- Profiling: the upgrade runs by request instead of server job to return the profile")
+    elif cf.profile and patch_features:
+        output("- Warning: ", font="arial 9 bold", sep="")
+        output("remote server patch does not support profiling, the update is not profiled")
+    # patched server returns load time, data files and records written of each module
+    use_upgrade_report = not use_async and 'remote_upgrade_modules' in patch_features
+
+    def output_log_error(error: dict, indent: str):
+        message = error['message'].strip().splitlines()[0] if error['message'].strip() else ''
+        output(f"{indent}{error['level']}: {message}", font="Consolas 9",
+               text_color='red' if error['level'] in ('ERROR', 'CRITICAL') else 'orange')
+
+    def output_upgrade_report(report: dict):
+        loaded = sorted(report['modules'].items(), key=lambda item: -item[1]['duration'])
+        if report['status']:
+            output(f"    - Server upgrade: {report['duration']:.2f} seconds, {len(loaded)} module(s) loaded",
+                   font="Consolas 9")
+        else:
+            # the error is reported as fault, show the modules logged errors while loading
+            loaded = [(tech_name, info) for tech_name, info in loaded if info['errors']]
+        for tech_name, info in loaded:
+            metrics.add_module_load(tech_name, info)
+            line = (f"        {tech_name}: {info['duration']:.2f}s, {info['data_file_count']} data file(s), "
+                    f"{info['records']} record(s)" + (f", {info['queries']} SQL queries" if 'queries' in info else ""))
+            if info['data_files']:
+                slowest = max(info['data_files'], key=lambda item: item['duration'])
+                line += f", slowest: {slowest['file']} ({slowest['duration']:.2f}s)"
+            if info['errors']:
+                line += f", {len(info['errors'])} warning(s) / error(s)"
+            output(line, font="Consolas 9")
+            for error in info['errors']:
+                output_log_error(error, " " * 10)
+        for error in report['errors']:
+            output_log_error(error, " " * 8)
+        for tech_name, state in report['not_installed'].items():
+            output(f"        {tech_name}: not installed (state: {state})", font="Consolas 9", text_color='red')
+
+    def output_profile(kind: str, profiles: list, modules: dict = None):
+        """ Save the profile reports of the server, print the hot spots and the modules with most SQL queries """
+        report_file = save_profile_report(cf, kind, profiles)
+        summary = merge_profiles(profiles, cf.profile_top)
+        output(f"    - Profile of {kind}: {summary['duration']:.2f}s, {summary['queries']} SQL queries, "
+               f"{summary['total_calls']} function calls", font="Consolas 9")
+        for error in dict.fromkeys(profile['error'] for profile in profiles if profile['error']):
+            output(f"        Profiler is not available: {error}", font="Consolas 9", text_color='orange')
+        if summary['functions']:
+            output(f"        {'own time':>9} {'cumulative':>11} {'calls':>9}  hot spot", font="Consolas 9")
+        for row in summary['functions'][:PROFILE_SUMMARY_ROWS]:
+            output(f"        {row['tottime']:>8.2f}s {row['cumtime']:>10.2f}s {row['calls']:>9}  {row['function']}",
+                   font="Consolas 9")
+        by_queries = sorted((item for item in (modules or {}).items() if item[1].get('queries')),
+                            key=lambda item: -item[1]['queries'])[:PROFILE_SUMMARY_ROWS]
+        if by_queries:
+            output("        Modules by SQL queries: " + ", ".join(
+                f"{tech_name} {info['queries']} ({info['duration']:.2f}s)" for tech_name, info in by_queries), font="Consolas 9")
+        output(f"        Report: {report_file}", font="Consolas 9")
+
+    throttle = server_limit(cf)
+
+    def upgrade_modules(ids: list, names: list, job_results: dict = None):
+        """
+        Upgrade, retry with exponential backoff while the server is busy, the last busy fault is raised
+        :param job_results: filled with the state and versions of each module after the upgrade job (async only)
+        """
+        attempt = 0
+        while True:
+            try:
+                if use_async:
+                    result = run_upgrade_job(models, cf, uid, ids, output, job_results)
+                elif use_upgrade_report:
+                    report = models.execute_kw(cf.db, uid, cf.password, model_name, 'remote_upgrade_modules', [names],
+                                               profile_kwargs)
+                    output_upgrade_report(report)
+                    if report.get('profile'):
+                        output_profile('upgrade', [report['profile']], report['modules'])
+                    if not report['status']:
+                        raise xmlrpc.client.Fault(1, report['traceback'] or report['error'])
+                    result = report['result']
+                else:
+                    result = models.execute_kw(cf.db, uid, cf.password, model_name, update_method, [ids])
+                throttle.on_success()
+                return result
+            except xmlrpc.client.Fault as e:
+                if SERVER_BUSY_MESSAGE not in str(e):
+                    raise
+                # less runs at the same time on this server (fleet), then wait before retry
+                throttle.on_busy()
+                if attempt >= cf.busy_retries or is_cancelled():
+                    raise
+                delay = min(cf.busy_backoff * 2 ** attempt, 300) * random.uniform(0.5, 1.0)
+                attempt += 1
+                output(f"    - Server is busy, retry {attempt}/{cf.busy_retries} in {delay:.0f} seconds...", font="Consolas 9")
+                if cancel_event is not None:
+                    cancel_event.wait(delay)
+                else:
+                    time.sleep(delay)
+                if is_cancelled():
+                    raise
+
+    modules_to_update = [item.strip() for item in cf.modules_to_update]
 
     if not is_gui:
-        print("\n", "=" * 70, sep='')
-    if cf.modules_to_update:
+        output("\n" + "=" * 70)
+    # state and versions before the upgrade (see `module_versions`): read by the plan, or before the upgrade
+    versions_before = None
+    if modules_to_update and cf.only_changed:
+        try:
+            with metrics.phase('plan'):
+                plan = plan_update(models, cf, uid, modules_to_update, cf.force_update)
+        except xmlrpc.client.Fault as e:
+            output_fault(e)
+            return False
+        output("- Upgrade plan" + (" (force upgrade all modules):" if cf.force_update else " (only changed modules):"))
+        for item in plan:
+            output(f"    {PLAN_SIGNS[item['action']]} {item['name']}", font="Consolas 9", sep="")
+            if item['state'] and item['state'] != 'installed':
+                output(f" (state: {item['state']})", font="Consolas 9", sep="")
+            elif item['state']:
+                output(f" ({item['latest_version']} -> {item['installed_version']})", font="Consolas 9", sep="")
+            output(f" [{item['action']}]", font="Consolas 9 bold",
+                   text_color={'upgrade': 'green', 'missing': 'red'}.get(item['action']))
+        for item in plan:
+            if item['action'] == 'skip':
+                journal.module_end(item['name'], 'skipped')
+        # module is not found still in the list to report it
+        modules_to_update = [item['name'] for item in plan if item['action'] != 'skip']
+        versions_before = {item['name']: {key: value for key, value in item.items() if key != 'action'}
+                           for item in plan if item['action'] != 'missing'}
+    # modules upgraded by the previous interrupted (or failed) run, they are not upgraded again
+    resumed = []
+    if modules_to_update and cf.resume:
+        upgraded = journal.upgraded_modules()
+        resumed = [name for name in modules_to_update if name in upgraded]
+        if resumed:
+            output("- Resume: ", sep="")
+            output(str(len(resumed)), font="arial 9 bold", sep="")
+            output(" module(s) upgraded by the previous run are skipped")
+            for tech_name in resumed:
+                upgrade_time = datetime.datetime.fromtimestamp(upgraded[tech_name]).strftime('%Y-%m-%d %H:%M:%S')
+                output(f"    = {tech_name} (upgraded at {upgrade_time})", font="Consolas 9")
+                journal.module_end(tech_name, 'resumed')
+            modules_to_update = [name for name in modules_to_update if name not in upgraded]
+        else:
+            output("- Resume: no module upgraded by the previous run")
+    # module name -> the requested dependency its upgrade is covered by
+    covered = {}
+    if modules_to_update and cf.collapse_dependencies:
+        try:
+            with metrics.phase('dependencies'):
+                depends = module_dependencies(models, cf, uid)
+        except xmlrpc.client.Fault as e:
+            output_fault(e)
+            return False
+        total_requested = len(modules_to_update)
+        modules_to_update, covered = collapse_modules(modules_to_update, depends)
+        output("- Dependency plan: ", sep="")
+        output(f"{total_requested}", font="arial 9 bold", sep="")
+        output(" requested, ", sep="")
+        output(f"{len(modules_to_update)}", font="arial 9 bold", sep="")
+        output(" to upgrade, ", sep="")
+        output(f"{len(covered)}", font="arial 9 bold", sep="")
+        output(" covered by an upgraded dependency")
+        for tech_name in modules_to_update:
+            output(f"    + {tech_name}", font="Consolas 9")
+            for covered_name, ancestor in covered.items():
+                if ancestor == tech_name:
+                    output(f"        - {covered_name}", font="Consolas 9")
+        if covered:
+            output("- Estimated savings: ", sep="")
+            if cf.batch_update:
+                output(f"{len(covered)} module(s) less in the batch (batch mode reloads one time)")
+            else:
+                output(f"{len(covered)}", font="arial 9 bold", sep="")
+                output(" registry reload(s)")
+    total_update = len(modules_to_update)
+    if modules_to_update:
         output("- Total module to update: ", sep="")
         output(str(total_update), font="arial 9 bold", sep="")
-        _m_list = "".join(f"\n    + {item}" for item in cf.modules_to_update)
+        _m_list = "".join(f"\n    + {item}" for item in modules_to_update)
         output(f", module list:{_m_list}")
+        estimate, known = timing_store.estimate(cf, modules_to_update, cf.batch_update)
+        if estimate:
+            finish_time = datetime.datetime.now() + datetime.timedelta(seconds=estimate)
+            output("- Estimated upgrade time: ", sep="")
+            output(format_duration(estimate), font="arial 9 bold", sep="")
+            output(f" (finish around {finish_time:%H:%M:%S}, history of {known}/{total_update} module(s))")
+        else:
+            output("- Estimated upgrade time: n/a (no history)")
     else:
         output("- No module to update")
     if not is_gui:
-        print("=" * 70, "\n", sep='')
-        input("Press Enter to continue...")
+        output("=" * 70 + "\n")
+        if interactive:
+            input("Press Enter to continue...")
         output(f"Running (current time is: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')})...\n", sep='')
 
     count = 0
     is_all_ok = True
-    for tech_name in cf.modules_to_update:
-        count += 1
+    # result of each module: True if upgraded
+    results = {}
+    upgraded_ids = []
+    # modules are not requested to update because the run is cancelled
+    cancelled = []
+    # modules answered by "server is busy" after all retries, the result is read from the server
+    busy_modules = []
+    # state and versions before the upgrade, to resolve the modules of batch update and to verify the modules answered
+    # by "server is busy"
+    if versions_before is None and modules_to_update and not is_cancelled():
         try:
-            output(f"- Requesting update module: ", sep="")
-            output(tech_name, font="arial 9 bold", sep="")
-            output("...")
-            ids = models.execute_kw(cf.db, uid, cf.password, model_name, "search", [[('name', '=', tech_name.strip())]])
+            with metrics.phase('versions'):
+                versions_before = module_versions(models, cf, uid, modules_to_update)
         except xmlrpc.client.Fault as e:
-            if 'Access denied' in str(e):
-                output("- ", sep="")
-                output("'Access denied'", font="arial 9 bold", sep="")
-                output(" please check user account and login password!")
-            else:
-                output("- ", sep="")
-                output("Error: ", font="arial 9 bold", sep="")
-                output(str(e), font="Consolas 9")
+            output_fault(e)
             return False
+    if modules_to_update and is_cancelled():
+        cancelled = modules_to_update
+    elif cf.batch_update and modules_to_update:
+        # resolve all modules in one request and upgrade them together, the server reload registry only one time
+        names = modules_to_update
+        output(f"- Requesting batch update for ", sep="")
+        output(str(total_update), font="arial 9 bold", sep="")
+        output(" module(s)...")
+        found = versions_before
+        ids = [found[name]['id'] for name in names if name in found and found[name]['state'] == 'installed']
+        result = None
+        log_file_path = None
+        server_busy = False
+        run_time = 0.0
+        job_results = {}
         if ids:
+            for tech_name in names:
+                if tech_name in found and found[tech_name]['state'] == 'installed':
+                    journal.module_start(tech_name)
             start_time = time.time()
-            log_file_path = None
-            server_busy = False
             try:
-                result = models.execute_kw(cf.db, uid, cf.password, model_name, update_method, [ids])
+                with metrics.phase('upgrade', module=','.join(name for name in names if name in found)):
+                    result = upgrade_modules(ids, [name for name in names
+                                                   if name in found and found[name]['state'] == 'installed'],
+                                             job_results)
             except xmlrpc.client.Fault as e:
                 fault = e.__str__()
                 log_file_path = log_to_file(fault, config_file=cf.config_file)
-                result = None
-                if 'The server is busy right now' in fault:
-                    server_busy = True
+                server_busy = SERVER_BUSY_MESSAGE in fault
+            run_time = time.time() - start_time
+        batch_ok = is_upgrade_success(result)
+        versions = {}
+        if batch_ok and all('installed_version' in job_results.get(name, {}) for name in names
+                            if name in found and found[name]['state'] == 'installed'):
+            # the upgrade job reports the state and versions of each module
+            versions = job_results
+        elif batch_ok:
+            # verify the version in database is the version of code after the upgrade, to report result of each module
+            try:
+                versions = module_versions(models, cf, uid, [name for name in names if name in found])
+            except xmlrpc.client.Fault as e:
+                output_fault(e)
+                return False
+        for tech_name in names:
+            count += 1
+            output_module(count, tech_name)
+            results[tech_name] = False
+            if tech_name not in found:
+                output("module is not found!", font='arial 9', text_color='red')
+                journal.module_end(tech_name, 'not_found')
                 is_all_ok = False
-
-            if (type(result) is dict and (('tag' in result and result['tag'] == 'reload') or ('url' in result and result['url'] == '/web'))) or server_busy:
-                # success, server response: client reload or redirect to home page
-                end_time = time.time()
-                output(f"- [{count}/{total_update}] Update module ", sep="")
-                output(tech_name, font='arial 9 bold', sep="")
-                output(" --- ", sep="")
-                output("OK" if not server_busy else "OK (server busy!)", font='arial 9', text_color='green', sep="")
-                output(f", run-time: {end_time - start_time:.2f} seconds" if not server_busy else ', run-time: n/a')
+            elif found[tech_name]['state'] != 'installed':
+                output("FAILED", font='arial 9', text_color='red', sep="")
+                output(f", module is not installed (state: {found[tech_name]['state']})")
+                journal.module_end(tech_name, 'not_installed', state=found[tech_name]['state'])
+                is_all_ok = False
+            elif server_busy:
+                busy_modules.append(tech_name)
+                output("BUSY", font='arial 9', text_color='orange', sep="")
+                output(", the result is verified after the update")
+                journal.module_end(tech_name, 'busy', run_time, batch=True)
+            elif batch_ok and tech_name in versions and is_module_upgraded(versions[tech_name]):
+                results[tech_name] = True
+                upgraded_ids.append(found[tech_name]['id'])
+                output("OK", font='arial 9', text_color='green')
+                journal.module_end(tech_name, 'ok', run_time, batch=True)
             else:
-                output(f"- [{count}/{total_update}] Update module ", sep="")
-                output(tech_name, font='arial 9 bold', sep="")
-                output(" --- ", sep="")
                 output("FAILED", font='arial 9', text_color='red', sep="")
-                output(", RESPONSE: ", sep="")
-                output(result, font="Consolas 9")
+                if batch_ok and tech_name in versions:
+                    output(f", module state: {versions[tech_name]['state']}, version in database "
+                           f"{versions[tech_name]['latest_version']}, version of code {versions[tech_name]['installed_version']}")
+                elif batch_ok:
+                    output(", module is not found after the upgrade")
+                else:
+                    output(", RESPONSE: ", sep="")
+                    output(result, font="Consolas 9")
+                journal.module_end(tech_name, 'failed', run_time, batch=True, log_file=log_file_path)
                 is_all_ok = False
-            if log_file_path:
-                output("    - Log file: ", sep="")
-                output(log_file_path, font="Consolas 9")
-        else:
-            output(f"- [{count}/{total_update}] Update module ", sep="")
+        if ids and batch_ok and not server_busy:
+            timing_store.update(cf, {}, batch=(run_time, len(ids)))
+        if ids:
+            output("- Batch update run-time: ", sep="")
+            output(f"{run_time:.2f}" if not server_busy else "n/a", font="arial 9 bold", sep="")
+            output(" seconds" if not server_busy else "")
+        if log_file_path:
+            output("    - Log file: ", sep="")
+            output(log_file_path, font="Consolas 9")
+    else:
+        # run-time of modules upgraded successfully, saved to the history after the loop
+        timings = {}
+        for tech_name in modules_to_update:
+            if is_cancelled():
+                cancelled = modules_to_update[count:]
+                break
+            count += 1
+            try:
+                output(f"- Requesting update module: ", sep="")
+                output(tech_name, font="arial 9 bold", sep="")
+                output("...")
+                with metrics.phase('search', module=tech_name):
+                    ids = models.execute_kw(cf.db, uid, cf.password, model_name, "search", [[('name', '=', tech_name)]])
+            except xmlrpc.client.Fault as e:
+                output_fault(e)
+                return False
+            if ids:
+                journal.module_start(tech_name)
+                start_time = time.time()
+                log_file_path = None
+                server_busy = False
+                job_results = {}
+                try:
+                    with metrics.phase('upgrade', module=tech_name):
+                        result = upgrade_modules(ids, [tech_name], job_results)
+                except xmlrpc.client.Fault as e:
+                    fault = e.__str__()
+                    log_file_path = log_to_file(fault, config_file=cf.config_file)
+                    result = None
+                    server_busy = SERVER_BUSY_MESSAGE in fault
+
+                results[tech_name] = is_upgrade_success(result)
+                # upgrade job: the reload action is returned even if the module is not upgraded, check its state
+                version = job_results.get(tech_name)
+                if results[tech_name] and version:
+                    results[tech_name] = is_module_upgraded(version)
+                journal.module_end(tech_name, 'ok' if results[tech_name] else 'busy' if server_busy else 'failed',
+                                   time.time() - start_time, log_file=log_file_path)
+                if server_busy:
+                    busy_modules.append(tech_name)
+                    output_module(count, tech_name)
+                    output("BUSY", font='arial 9', text_color='orange', sep="")
+                    output(", the result is verified after the update")
+                elif results[tech_name]:
+                    upgraded_ids.extend(ids)
+                    end_time = time.time()
+                    timings[tech_name] = end_time - start_time
+                    output_module(count, tech_name)
+                    output("OK", font='arial 9', text_color='green', sep="")
+                    output(f", run-time: {end_time - start_time:.2f} seconds")
+                else:
+                    output_module(count, tech_name)
+                    output("FAILED", font='arial 9', text_color='red', sep="")
+                    if is_upgrade_success(result) and version:
+                        output(f", module state: {version['state']}, version in database {version['latest_version']}, "
+                               f"version of code {version.get('installed_version', '')}")
+                    else:
+                        output(", RESPONSE: ", sep="")
+                        output(result, font="Consolas 9")
+                    is_all_ok = False
+                if log_file_path:
+                    output("    - Log file: ", sep="")
+                    output(log_file_path, font="Consolas 9")
+            else:
+                results[tech_name] = False
+                output_module(count, tech_name)
+                output("module is not found!", font='arial 9', text_color='red')
+                journal.module_end(tech_name, 'not_found')
+                is_all_ok = False
+        timing_store.update(cf, timings)
+    if busy_modules:
+        output("- Verify module(s) answered by server busy: ", sep="")
+        output(str(len(busy_modules)), font="arial 9 bold")
+        try:
+            with metrics.phase('verify'):
+                verified = verify_upgrade(models, cf, uid, busy_modules, versions_before)
+        except xmlrpc.client.Fault as e:
+            output_fault(e)
+            verified = {}
+        for tech_name in busy_modules:
+            item = verified.get(tech_name)
+            results[tech_name] = bool(item and item['upgraded'])
+            output("    - ", sep="")
             output(tech_name, font='arial 9 bold', sep="")
             output(" --- ", sep="")
-            output("module is not found!", font='arial 9', text_color='red')
+            if results[tech_name]:
+                journal.module_end(tech_name, 'ok', verified=True)
+                upgraded_ids.append(item['id'])
+                output("OK", font='arial 9', text_color='green', sep="")
+                output(f" (verified: installed, version {item['previous_version']} -> {item['latest_version']})")
+            elif item and not item['verifiable']:
+                # no new version before the upgrade: the module is not known to be upgraded, keep it as busy
+                journal.module_end(tech_name, 'busy', verified=False)
+                output("NOT VERIFIED", font='arial 9', text_color='orange', sep="")
+                output(f" (no new version to compare, version {item['latest_version']}), the upgrade may not be done")
+                is_all_ok = False
+            else:
+                journal.module_end(tech_name, 'failed', verified=True)
+                output("FAILED", font='arial 9', text_color='red', sep="")
+                if item:
+                    output(f" (verified: state {item['state']}, version in database {item['latest_version']}, "
+                           f"version of code {item['installed_version']})")
+                else:
+                    output(" (not verified)")
+                is_all_ok = False
+    if cancelled:
+        output("=== CANCEL ===", font="arial 9 bold")
+        output("- Module(s) not updated: ", sep="")
+        output(", ".join(cancelled), font="Consolas 9")
+        for tech_name in cancelled:
+            journal.module_end(tech_name, 'cancelled')
+        is_all_ok = False
+    for tech_name, ancestor in covered.items():
+        # button_upgrade of the dependency also upgrades all installed modules depend on it
+        results[tech_name] = results.get(ancestor, False)
+        journal.module_end(tech_name, 'covered' if results[tech_name] else 'failed', covered_by=ancestor)
+        output("- Update module ", sep="")
+        output(tech_name, font='arial 9 bold', sep="")
+        output(" --- ", sep="")
+        if results[tech_name]:
+            output("OK", font='arial 9', text_color='green', sep="")
+            output(f", upgraded with dependency: {ancestor}")
+        else:
+            output("FAILED", font='arial 9', text_color='red', sep="")
+            output(f", dependency {ancestor} is not upgraded")
             is_all_ok = False
 
-    if cf.language_to_update:
+    if cf.language_to_update and is_cancelled():
+        output("- Translation update is cancelled")
+        is_all_ok = False
+    elif cf.language_to_update:
+        translation_start = time.time()
+        # result of the translation is tracked apart from the module upgrade
+        is_upgrade_ok, is_all_ok = is_all_ok, True
         # odoo from version 11.0 required patch to remote call internal function _update_translations
         try:
             required_patch_odoo_versions = remote_odoo_version >= 11
@@ -224,75 +1995,654 @@ def run_update(cf: Config, output_handler: callable = None, is_gui: bool = False
             required_patch_odoo_versions = False
             output("- Cannot get remote server version from text: ", sep="")
             output(remote_odoo_version, font="arial 9 bold")
-        code = cf.language_to_update.strip().split(" ")[0] if " " in cf.language_to_update.strip() else cf.language_to_update.strip()
-        output("- Updating translation for language code: ", sep="")
-        output(code, font="arial 9 bold")
+        codes = language_codes(cf.language_to_update)
+        output("- Updating translation for language code(s): ", sep="")
+        output(", ".join(codes), font="arial 9 bold")
         log_text = ""
         try:
-            code_ids = models.execute_kw(cf.db, uid, cf.password, "res.lang", "search", [[('code', '=', code)]])
-            if code_ids:
-                start_time = time.time()
-                mods = models.execute_kw(cf.db, uid, cf.password, "ir.module.module", "search", [[('state', '=', 'installed')]])
-                output("  - ", sep="")
-                output(str(len(mods)), font="arial 9 bold", sep="")
-                output(" modules to update translate")
-                if required_patch_odoo_versions:
-                    result = models.execute_kw(cf.db, uid, cf.password, "ir.module.module", "remote_update_translation", [mods], {'filter_lang': code, 'context': {'overwrite': True}})
-                else:
-                    # using native function of odoo, response nothing
-                    result = False
-                    try:
-                        models.execute_kw(cf.db, uid, cf.password, "ir.module.module", "update_translations", [mods], {'filter_lang': code, 'context': {'overwrite': True}})
-                    except Exception as e:
-                        if "cannot marshal None unless allow_none is enabled" in e.__str__():
-                            result = True
-                        else:
-                            log_text = log_text + f"\nError report:\n{e.__str__()}" if log_text else e.__str__()
-
-                if type(result) is dict and 'status' in result:
-                    if result['status']:
-                        output("  - Update ", sep="")
-                        output("success", text_color="green")
-                        output("  - Duration: ", sep="")
-                        output(f"{int(time.time() - start_time)}", font="arial 9 bold", sep="")
-                        output(" second(s)")
-                    else:
-                        log_text += f"Update error logs:\n{result['error']}"
-                        output("  - Update ", sep="")
-                        output("failed", text_color="red")
-                        output("  - Error message: ", sep="")
-                        output(result['error'], font="Consolas 9")
-                        is_all_ok = False
-                elif type(result) is bool:
-                    if result:
-                        output("  - Update ", sep="")
-                        output("success", text_color="green")
-                        output("  - Duration: ", sep="")
-                        output(f"{int(time.time() - start_time)}", font="arial 9 bold", sep="")
-                        output(" second(s)")
-                    else:
-                        output("  - Update ", sep="")
-                        output("failed", text_color="red", sep="")
-                        output(". Please check server logs.")
-                        is_all_ok = False
-                else:
-                    output("  - Unknown response: ", sep="")
-                    output(str(result), font="Consolas 9")
-                    is_all_ok = False
-            else:
-                output(f"  - Could not find the language code: ", sep="")
-                output(code, font="arial 9 bold", sep="")
+            # search of res.lang returns only active languages
+            active_codes = [lang['code'] for lang in models.execute_kw(
+                cf.db, uid, cf.password, "res.lang", "search_read", [[('code', 'in', codes)]], {'fields': ['code']})]
+            missing = [code for code in codes if code not in active_codes]
+            if missing:
+                output(f"  - Could not find the language code(s): ", sep="")
+                output(", ".join(missing), font="arial 9 bold", sep="")
                 output(" active in database, please check it is correct and installed")
                 is_all_ok = False
+            codes = [code for code in codes if code in active_codes]
+            if codes:
+                # modules upgraded by this run, their translation is updated even if done by an interrupted run
+                run_upgraded_ids = list(upgraded_ids)
+                if resumed:
+                    # the previous run was interrupted before updating translation of its upgraded modules
+                    upgraded_ids += models.execute_kw(cf.db, uid, cf.password, "ir.module.module", "search",
+                                                      [[('name', 'in', resumed)]])
+                # all installed modules only on request (full refresh) or for a translation only run
+                if cf.translation_scope == 'all' or not cf.modules_to_update:
+                    mods = models.execute_kw(cf.db, uid, cf.password, "ir.module.module", "search", [[('state', '=', 'installed')]])
+                elif upgraded_ids:
+                    mods = module_dependents(models, cf, uid, upgraded_ids)
+                    output("  - Scope: modules upgraded in this run and modules depend on them")
+                else:
+                    mods = []
+                    output("  - Scope: no module is upgraded in this run, translation is not updated (use full "
+                           "translation refresh to update all installed modules)")
+                if mods:
+                    output("  - ", sep="")
+                    output(str(len(mods)), font="arial 9 bold", sep="")
+                    output(" modules to update translate")
+                    translation = update_translations(models, cf, uid, codes, mods, patch_features, output,
+                                                      required_patch_odoo_versions, run_upgraded_ids, cancel_event,
+                                                      output_profile)
+                    log_text = translation['log']
+                    if not translation['ok']:
+                        is_all_ok = False
+                    for code, result in translation['languages'].items():
+                        if result['status'] is not None:
+                            metrics.add_phase('translation_lang', translation_start, duration=result['duration'],
+                                              lang=code, status='ok' if result['status'] else 'failed')
         except xmlrpc.client.Fault as e:
             log_text = log_text + f"\nXMLRPC error:\n{e.__str__()}" if log_text else e.__str__()
+        if log_text:
             log_file_path_lang = log_to_file(log_text, suffix="_trans_log_", config_file=cf.config_file)
             output("    - Log file: {}".format(log_file_path_lang))
             is_all_ok = False
+        metrics.add_phase('translation', translation_start, lang=",".join(language_codes(cf.language_to_update)))
+        journal.translation_end(is_all_ok, language_codes(cf.language_to_update))
+        is_all_ok = is_upgrade_ok and is_all_ok
 
     return is_all_ok
 
 
+def compare_backends(cf: Config, repeat: int = 3):
+    """
+    Run the same read only workload (version, login, search / read installed modules, read languages) on all
+    remote call backends, print payload size and latency of each backend
+    """
+    print(f"Compare remote call backends on: {cf.url}, database: {cf.db}, repeat: {repeat}")
+    rows = []
+    for name, backend_class in RPC_BACKENDS.items():
+        connection_pool.clear()
+        backend = backend_class(cf)
+        start_time = time.time()
+        try:
+            for _ in range(repeat):
+                backend.version()
+                uid = backend.authenticate(cf.db, cf.username, cf.password, {})
+                backend.execute_kw(cf.db, uid, cf.password, "ir.module.module", "search", [[('state', '=', 'installed')]])
+                backend.execute_kw(cf.db, uid, cf.password, "ir.module.module", "search_read",
+                                   [[('state', '=', 'installed')]], {'fields': ['name', 'state', 'latest_version']})
+                backend.execute_kw(cf.db, uid, cf.password, "res.lang", "search_read", [[]], {'fields': ['code', 'name']})
+        except Exception as e:
+            print(f"  - {name}: error: {e}")
+            continue
+        rows.append((name, backend.calls, backend.bytes_sent, backend.bytes_received, time.time() - start_time))
+    print(f"  {'backend':<10}{'calls':>7}{'sent (B)':>12}{'received (B)':>15}{'total (s)':>11}{'per call (ms)':>15}")
+    for name, calls, sent, received, run_time in rows:
+        print(f"  {name:<10}{calls:>7}{sent:>12}{received:>15}{run_time:>11.3f}{run_time / calls * 1000:>15.1f}")
+    return rows
+
+
+def decrypt_password(password: str) -> str:
+    """ Decrypt password encrypted by Fernet with key in environment variable, cryptography is imported only here """
+    from cryptography.fernet import Fernet
+    fernet = Fernet(os.getenv(FERNET_KEY).encode())
+    return fernet.decrypt(password.encode()).decode()
+
+
+def load_config(config_file: str, password: str = None, config: dict = None) -> Config:
+    """ Read config file (or use given config dict) to Config object, the encrypted password is decrypted by Fernet """
+    if config is None:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    config = dict(config)
+    if config.get('password') and config['password'].startswith('gAAAAA') and os.getenv(FERNET_KEY, ''):
+        config['password'] = decrypt_password(config['password'])
+    erp_config = Config(**config)
+    erp_config.config_file = config_file
+    if password:
+        erp_config.password = password
+    return erp_config
+
+
+def fleet_targets(source: str) -> list:
+    """
+    Collect fleet targets from a directory (all *.json files), a glob pattern, a single config file or a manifest file.
+    Manifest is a JSON list (or dict with key "targets") of config file paths (relative to manifest) or config dicts,
+    config dict can have key "name" to name the target.
+    :return: list of tuple (target name, config file path, config dict or None)
+    """
+    targets = []
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.json')))
+    elif glob.has_magic(source):
+        paths = sorted(glob.glob(source))
+    else:
+        with open(source, "r") as f:
+            content = json.load(f)
+        if isinstance(content, dict) and 'targets' not in content:
+            paths = [source]
+        else:
+            paths = []
+            manifest_dir = os.path.dirname(os.path.abspath(source))
+            for item in content['targets'] if isinstance(content, dict) else content:
+                if isinstance(item, dict):
+                    item = dict(item)
+                    name = item.pop('name', '') or f"{item.get('db', 'target')}_{len(targets) + 1}"
+                    targets.append((name, f"{name}.json", item))
+                else:
+                    paths.append(item if os.path.isabs(item) else os.path.join(manifest_dir, item))
+    for path in paths:
+        targets.append((os.path.basename(path).replace('.json', ''), path, None))
+    # target name is used for output file name, make it unique
+    names = set()
+    for i, (name, path, config) in enumerate(targets):
+        if name in names:
+            name = f"{name}_{i + 1}"
+            targets[i] = (name, path, config)
+        names.add(name)
+    return targets
+
+
+class FleetOutput:
+    """ Output handler write output of one fleet target to its own log file """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.file = open(file_path, 'w', errors='ignore')
+
+    def __call__(self, msg, sep="\n", font: str = None, text_color: str = None):
+        self.file.write(f"{msg}{sep}")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_fleet(source: str, password: str = None, workers: int = 4, per_server: int = 2, per_db: int = 1,
+              overrides: dict = None, preflight_check: bool = True):
+    """
+    Run update for many targets concurrently
+    :param source: directory, glob pattern or manifest of targets, see `fleet_targets`
+    :param password: overwrite password of all targets
+    :param workers: max number of targets run at the same time
+    :param per_server: max number of targets run at the same time on one server (host of url)
+    :param per_db: max number of runs at the same time on one database (same url and db)
+    :param overrides: config attributes to overwrite on all targets, ex: {'batch_update': True}
+    :param preflight_check: check all targets in parallel before the first upgrade, failed targets are not run
+    :return: True if all targets are updated successfully
+    """
+    targets = fleet_targets(source)
+    if not targets:
+        print(f"No target found from: {source}")
+        return False
+    out_dir = os.path.join(base_dir, 'logs', 'fleet_' + datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
+    os.makedirs(out_dir)
+    limit_lock = threading.Lock()
+    db_limits = {}
+
+    def get_limit(limits: dict, key, size: int) -> threading.Semaphore:
+        with limit_lock:
+            if key not in limits:
+                limits[key] = threading.Semaphore(max(size, 1))
+            return limits[key]
+
+    def load_target(config_file: str, config: dict):
+        cf = load_config(config_file, password, config)
+        for key, value in (overrides or {}).items():
+            setattr(cf, key, value)
+        return cf
+
+    print(f"Fleet update: {len(targets)} target(s), workers: {workers}, per server: {per_server}, per database: {per_db}")
+    print(f"Output directory: {out_dir}")
+    fleet_start = time.time()
+    # configs are loaded and checked before the first upgrade, a target is not run if it has an error
+    configs, errors = [], {}
+    for name, config_file, config in targets:
+        try:
+            configs.append(load_target(config_file, config))
+        except Exception:
+            configs.append(None)
+            errors[name] = traceback.format_exc()
+            print(f"[FAILED] {name}: cannot read config")
+    if preflight_check:
+        checked = [(name, cf) for (name, _, _), cf in zip(targets, configs) if cf is not None]
+        for (name, _), check in zip(checked, preflight_targets(checked, workers)):
+            if not check['ok']:
+                errors[name] = "Pre-flight check failed:\n" + "\n".join(f"- {error}" for error in check['errors'])
+        if errors:
+            print(f"{len(errors)} target(s) are not run, {len(targets) - len(errors)} target(s) to run")
+    # longest targets first (history of run-time), the total wall time is shorter with the same number of workers
+    store = timing_store.load()
+    estimates = {name: timing_store.estimate(cf, cf.modules_to_update, cf.batch_update, store)[0]
+                 for (name, _, _), cf in zip(targets, configs) if cf is not None and name not in errors}
+    order = sorted(range(len(targets)), key=lambda i: -estimates.get(targets[i][0], 0.0))
+    if any(estimates.values()):
+        worker_loads = [0.0] * min(max(workers, 1), len(estimates) or 1)
+        for i in order:
+            if targets[i][0] in estimates:
+                worker_loads[worker_loads.index(min(worker_loads))] += estimates[targets[i][0]]
+        print(f"Estimated wall time: {format_duration(max(worker_loads))} "
+              f"(sum of run-time: {format_duration(sum(estimates.values()))}), longest targets start first")
+
+    def run_target(name: str, cf: Config):
+        stream = FleetOutput(os.path.join(out_dir, f"{name}.log"))
+        start_time = time.time()
+        is_ok = False
+        try:
+            if name in errors:
+                stream(errors[name])
+                return False, 0.0, stream.file_path
+            db_limit = get_limit(db_limits, (cf.url.rstrip('/'), cf.db), per_db)
+            # the limit of the server is lowered while the server reports busy
+            with db_limit, server_limit(cf, per_server):
+                start_time = time.time()
+                print(f"[start] {name}")
+                is_ok = bool(run_update(cf, stream, interactive=False))
+        except Exception:
+            stream(traceback.format_exc())
+        finally:
+            stream.close()
+        run_time = time.time() - start_time
+        print(f"[{'done' if is_ok else 'FAILED'}] {name} ({run_time:.2f} seconds)")
+        return is_ok, run_time, stream.file_path
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {i: executor.submit(run_target, targets[i][0], configs[i]) for i in order}
+        results = [futures[i].result() for i in range(len(targets))]
+    wall_time = time.time() - fleet_start
+
+    print("\n" + "=" * 70)
+    print("Fleet summary:")
+    for (name, _, _), (is_ok, run_time, log_file) in zip(targets, results):
+        status = "OK" if is_ok else "FAILED"
+        if color_allow:
+            status = colored(f"{status:<6}", 'green' if is_ok else 'red')
+        else:
+            status = f"{status:<6}"
+        print(f"  {status} {run_time:>9.2f}s  {name}  -> {log_file}")
+    total_ok = sum(1 for is_ok, _, _ in results if is_ok)
+    print(f"Total: {len(results)} target(s), {total_ok} OK, {len(results) - total_ok} FAILED, "
+          f"wall time: {wall_time:.2f} seconds, sum of run-time: {sum(r[1] for r in results):.2f} seconds")
+    print("=" * 70)
+    return total_ok == len(results)
+
+
+class ServiceJob:
+    """ Upgrade and / or translation job submitted to the service, output of its run is kept for status and stream """
+
+    def __init__(self, name: str, cf: Config):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.cf = cf
+        self.modules = [module.strip() for module in cf.modules_to_update if module.strip()]
+        self.languages = language_codes(cf.language_to_update)
+        self.state = 'queued'
+        self.ok = None
+        self.error = ''
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.merged_with = []
+        # module name -> result of the run (see `RunJournal.module_end`), result of the translation
+        self.results = {}
+        self.translation = None
+        self.output = []
+        self.cancel_event = None
+
+    @property
+    def db_key(self) -> tuple:
+        return self.cf.url.rstrip('/'), self.cf.db
+
+    @property
+    def merge_key(self) -> str:
+        """
+        Jobs with the same connection, options and languages can run together, modules are merged. A translation only
+        job (all installed modules) runs apart from the jobs with modules.
+        """
+        options = {key: value for key, value in vars(self.cf).items()
+                   if key not in ('modules_to_update', 'language_to_update', 'batch_update', 'config_file')}
+        options.update(languages=sorted(self.languages), translation_only=not self.modules)
+        return json.dumps(options, sort_keys=True, default=str)
+
+    def set_result(self, report: dict):
+        """
+        Result of the job from the results of the (merged) run: its own modules are upgraded (or covered, unchanged,
+        resumed) and its translation is updated, a failed module of another job of the batch does not fail it
+        """
+        modules = report.get('modules', {})
+        self.results = {name: modules.get(name, 'not_run') for name in self.modules}
+        self.translation = report.get('translation') if self.languages else None
+        self.ok = all(result in ('ok', 'covered', 'skipped', 'resumed') for result in self.results.values()) and \
+            (not self.languages or self.translation is True)
+
+    def status(self, output: bool = False) -> dict:
+        status = {
+            'job_id': self.job_id, 'name': self.name, 'url': self.cf.url, 'db': self.cf.db, 'state': self.state,
+            'ok': self.ok, 'error': self.error, 'modules': self.modules, 'languages': self.languages,
+            'results': self.results, 'translation': self.translation, 'merged_with': self.merged_with, 'created': self.created, 'started': self.started,
+            'finished': self.finished, 'duration': (self.finished or time.time()) - self.started if self.started else None,
+        }
+        if output:
+            status['output'] = "".join(self.output)
+        return status
+
+
+class UpgradeService:
+    """
+    Run jobs submitted by the HTTP API of `serve`: jobs of one database run one after another, the pending jobs of a
+    database (same connection and options) are merged into one batch run when the previous run is done. The connection
+    pool, login session cache and server limits are kept warm between the runs.
+    """
+    ACTIVE_STATES = ('queued', 'running', 'cancelling')
+
+    def __init__(self, password: str = None, overrides: dict = None, per_server: int = 2, max_finished: int = 200):
+        """
+        :param password: overwrite password of all jobs
+        :param overrides: config attributes to overwrite on all jobs, ex: {'metrics': True}
+        :param per_server: max number of runs at the same time on one server (host of url)
+        :param max_finished: number of finished jobs kept for status requests
+        """
+        self.password = password
+        self.overrides = overrides or {}
+        self.per_server = per_server
+        self.max_finished = max_finished
+        # one condition for jobs, queues and output: the streams wait for new output of their job
+        self.condition = threading.Condition()
+        self.jobs = {}
+        self.queues = {}
+        self.workers = {}
+        self.stopping = False
+
+    def submit(self, request: dict) -> ServiceJob:
+        """
+        Add a job, `request` keys: config (config file path or config dict), optional name, modules, languages and
+        options (config attributes, ex: {"translation_scope": "all"})
+        :raise ValueError: invalid request
+        """
+        config = request.get('config')
+        if isinstance(config, str):
+            if not os.path.isfile(config):
+                raise ValueError(f"The config file {config} is not found")
+            config_file, config = config, None
+        elif isinstance(config, dict):
+            config_file = f"{request.get('name') or config.get('db', 'job')}.json"
+        else:
+            raise ValueError("The config (file path or object) is required")
+        cf = load_config(config_file, self.password, config)
+        options = dict(request.get('options') or {}, **self.overrides)
+        unknown = [key for key in options if key not in Config.__annotations__]
+        if unknown:
+            raise ValueError(f"Unknown option(s): {', '.join(unknown)}")
+        for key, value in options.items():
+            setattr(cf, key, value)
+        if 'modules' in request:
+            cf.modules_to_update = list(request['modules'] or [])
+        if 'languages' in request:
+            cf.language_to_update = language_codes(request['languages'])
+        if not cf.url or not cf.db:
+            raise ValueError("Missing config for remote server URL and/or database name")
+        job = ServiceJob(request.get('name') or os.path.basename(config_file).replace('.json', ''), cf)
+        if not job.modules and not job.languages:
+            raise ValueError("Please input module(s) or language(s) to update")
+        with self.condition:
+            if self.stopping:
+                raise ValueError("The service is stopping")
+            self.jobs[job.job_id] = job
+            self.queues.setdefault(job.db_key, []).append(job)
+            print(f"[queued] {job.job_id} {job.name}: {len(job.modules)} module(s), language(s): "
+                  f"{', '.join(job.languages) or '-'}")
+            if job.db_key not in self.workers:
+                worker = threading.Thread(target=self.run_queue, args=(job.db_key,), name=f"service-{job.cf.db}")
+                self.workers[job.db_key] = worker
+                worker.start()
+            self.prune()
+        return job
+
+    def prune(self):
+        """ Remove the oldest finished jobs over the limit, called with the condition held """
+        finished = [job for job in self.jobs.values() if job.state not in self.ACTIVE_STATES]
+        for job in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job.job_id]
+
+    def cancel(self, job_id: str) -> ServiceJob:
+        """ Cancel a queued job, a running run is stopped before the next module when all of its jobs are cancelled """
+        with self.condition:
+            job = self.jobs[job_id]
+            if job.state == 'queued':
+                self.queues[job.db_key].remove(job)
+                job.state, job.finished = 'cancelled', time.time()
+            elif job.state == 'running':
+                job.state = 'cancelling'
+                run_jobs = [self.jobs.get(other_id) for other_id in job.merged_with] + [job]
+                if all(run_job is None or run_job.state == 'cancelling' for run_job in run_jobs):
+                    job.cancel_event.set()
+            self.condition.notify_all()
+        return job
+
+    def run_queue(self, db_key: tuple):
+        """ Worker of one database, run the pending jobs until the queue is empty """
+        while True:
+            with self.condition:
+                pending = self.queues.get(db_key)
+                if not pending or self.stopping:
+                    self.queues.pop(db_key, None)
+                    self.workers.pop(db_key, None)
+                    return
+                merge_key = pending[0].merge_key
+                batch = [job for job in pending if job.merge_key == merge_key]
+                self.queues[db_key] = [job for job in pending if job.merge_key != merge_key]
+                cancel_event = threading.Event()
+                for job in batch:
+                    job.state, job.started, job.cancel_event = 'running', time.time(), cancel_event
+                    job.merged_with = [other.job_id for other in batch if other is not job]
+                self.condition.notify_all()
+            self.run_batch(batch, cancel_event)
+
+    def run_batch(self, batch: list, cancel_event: threading.Event):
+        cf = batch[0].cf
+        cf.modules_to_update = list(dict.fromkeys(name for job in batch for name in job.modules))
+        cf.language_to_update = list(dict.fromkeys(code for job in batch for code in job.languages))
+        if len(batch) > 1 and cf.modules_to_update:
+            # merged jobs: one registry reload for all modules
+            cf.batch_update = True
+
+        # output is kept by lines, a message can be a part of line
+        line = ""
+
+        def output(msg, sep="\n", font: str = None, text_color: str = None, flush: bool = False):
+            nonlocal line
+            line += f"{msg}{sep}"
+            if "\n" not in line and not flush:
+                return
+            text, line = (line, "") if flush else (line[:line.rindex("\n") + 1], line[line.rindex("\n") + 1:])
+            with self.condition:
+                for job in batch:
+                    job.output.append(text)
+                self.condition.notify_all()
+
+        print(f"[start] {cf.db}: job(s) {', '.join(job.job_id for job in batch)}, {len(cf.modules_to_update)} "
+              f"module(s), language(s): {', '.join(cf.language_to_update) or '-'}")
+        is_ok, error, report = False, '', {}
+        try:
+            # the limit of the server is lowered while the server reports busy
+            with server_limit(cf, self.per_server):
+                is_ok = bool(run_update(cf, output, interactive=False, cancel_event=cancel_event, report=report))
+        except Exception:
+            error = traceback.format_exc()
+            output(error)
+        if line:
+            output("", sep="", flush=True)
+        with self.condition:
+            for job in batch:
+                job.set_result(report)
+                job.ok = job.ok and not error
+                job.error, job.finished = error, time.time()
+                job.state = 'cancelled' if job.state == 'cancelling' else 'done' if job.ok else 'failed'
+            self.condition.notify_all()
+        print(f"[{'done' if is_ok else 'FAILED'}] {cf.db}: job(s) {', '.join(job.job_id for job in batch)} "
+              f"({time.time() - batch[0].started:.2f} seconds)")
+
+    def stop(self):
+        """ Stop the running runs before their next module and drop the queued jobs """
+        with self.condition:
+            self.stopping = True
+            for job in self.jobs.values():
+                if job.state == 'queued':
+                    job.state, job.finished = 'cancelled', time.time()
+                elif job.state == 'running':
+                    job.cancel_event.set()
+            self.condition.notify_all()
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.join()
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API of the service:
+    POST /jobs (JSON body, see `UpgradeService.submit`), GET /jobs, GET /jobs/<id>, GET /jobs/<id>/stream (JSON lines
+    of output until the job is finished), DELETE /jobs/<id> (cancel), GET /health
+    """
+    server_version = f"OdooRUR/{VERSION}"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code: int, data):
+        body = json.dumps(data, default=str).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self) -> bool:
+        token = os.getenv(SERVICE_TOKEN, '')
+        if token and not secrets.compare_digest(self.headers.get('Authorization', ''), f"Bearer {token}"):
+            self.send_json(401, {'error': 'Unauthorized'})
+            return False
+        return True
+
+    def find_job(self, job_id: str):
+        with self.server.service.condition:
+            job = self.server.service.jobs.get(job_id)
+        if job is None:
+            self.send_json(404, {'error': f"Job {job_id} is not found"})
+        return job
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        service = self.server.service
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts == ['health']:
+            with service.condition:
+                states = [job.state for job in service.jobs.values()]
+                queues = {f"{url}/{db}": len(jobs) for (url, db), jobs in service.queues.items()}
+            self.send_json(200, {'status': 'stopping' if service.stopping else 'ok', 'version': VERSION,
+                                 'jobs': {state: states.count(state) for state in set(states)}, 'queues': queues})
+        elif parts == ['jobs']:
+            # the status is built under the lock, it is sent after: a slow client does not block the runs
+            with service.condition:
+                statuses = [job.status() for job in service.jobs.values()]
+            self.send_json(200, statuses)
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.find_job(parts[1])
+            if job:
+                with service.condition:
+                    status = job.status(output=True)
+                self.send_json(200, status)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'stream':
+            job = self.find_job(parts[1])
+            if job:
+                self.stream(job)
+        else:
+            self.send_json(404, {'error': f"Not found: {self.path}"})
+
+    def stream(self, job: ServiceJob):
+        """ Write JSON lines: state changes and output of the job, the last line is the job status """
+        service = self.server.service
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        position, state = 0, None
+        try:
+            while True:
+                with service.condition:
+                    if position >= len(job.output) and job.state == state and state in service.ACTIVE_STATES:
+                        service.condition.wait(timeout=15)
+                    chunks, position = job.output[position:], len(job.output)
+                    events = [{'event': 'output', 'text': text} for text in chunks]
+                    if job.state != state:
+                        state = job.state
+                        events.append({'event': 'state', 'state': state})
+                    is_finished = state not in service.ACTIVE_STATES
+                    if is_finished:
+                        events.append(dict(job.status(), event='done'))
+                # an empty line keeps the connection alive while the job is waiting
+                self.wfile.write("".join(json.dumps(event, default=str) + "\n" for event in events).encode() or b"\n")
+                self.wfile.flush()
+                if is_finished:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if urlparse(self.path).path.strip('/') != 'jobs':
+            self.send_json(404, {'error': f"Not found: {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("The request must be a JSON object")
+            job = self.server.service.submit(request)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        with self.server.service.condition:
+            status = job.status()
+        self.send_json(202, status)
+
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self.send_json(404, {'error': f"Not found: {self.path}"})
+            return
+        job = self.find_job(parts[1])
+        if job:
+            job = self.server.service.cancel(job.job_id)
+            with self.server.service.condition:
+                status = job.status()
+            self.send_json(200, status)
+
+
+def serve(address: str, password: str = None, per_server: int = 2, overrides: dict = None):
+    """
+    Run the upgrade service until interrupted (Ctrl+C), see `ServiceRequestHandler` for the HTTP API
+    :param address: "port" or "host:port", default host is 127.0.0.1 (local only)
+    """
+    host, _, port = address.rpartition(':')
+    server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), ServiceRequestHandler)
+    server.daemon_threads = True
+    server.service = UpgradeService(password, overrides, per_server)
+    host, port = server.server_address[:2]
+    print(f"Upgrade service is listening on: http://{host}:{port}"
+          + (" (token required)" if os.getenv(SERVICE_TOKEN, '') else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping: running updates stop before their next module, queued jobs are cancelled...")
+    finally:
+        server.service.stop()
+        server.server_close()
+
+
 def console_mode():
     if len(sys.argv) <= 1:
         if not color_allow:
@@ -302,24 +2652,126 @@ def console_mode():
             print("Required call with config file path, ex: " + colored('python app.py /path/to/config.json', 'green')
                   + " or to overwrite password: " + colored('python app.py /path/to/config.json ', 'green') + colored('my-password', 'red'))
     else:
-        if os.path.isfile(sys.argv[1]):
-            with open(sys.argv[1], "r") as f:
-                config = json.load(f)
-                if config['password'] and config['password'].startswith('gAAAAA') and os.getenv(FERNET_KEY, ''):
-                    fernet = Fernet(os.getenv(FERNET_KEY).encode())
-                    config['password'] = fernet.decrypt(config['password'].encode()).decode()
-                erp_config = Config(**config)
-                if len(sys.argv) == 3:
-                    erp_config.password = sys.argv[2]
+        parser = argparse.ArgumentParser(description="Run module update on remote Odoo server")
+        parser.add_argument('config', nargs='?', default=None, help="path to config file")
+        parser.add_argument('password', nargs='?', default=None, help="overwrite password in config file")
+        parser.add_argument('--batch', action='store_true', help="upgrade all modules in one request (one registry reload)")
+        parser.add_argument('--fleet', metavar='SOURCE',
+                            help="run many targets concurrently, SOURCE is a directory, a glob pattern or a manifest file")
+        parser.add_argument('--workers', type=int, default=4, help="fleet mode: max targets run at the same time")
+        parser.add_argument('--per-server', type=int, default=2,
+                            help="fleet / service mode: max targets run at the same time on one server")
+        parser.add_argument('--per-db', type=int, default=1, help="fleet mode: max runs at the same time on one database")
+        parser.add_argument('--no-preflight', dest='preflight', action='store_false', default=None,
+                            help="fleet mode: do not check all targets before the first upgrade")
+        parser.add_argument('--serve', metavar='[HOST:]PORT',
+                            help="run upgrade service with HTTP API to submit jobs, jobs of a database are run one "
+                                 "after another and pending jobs are merged into one batch (default host: 127.0.0.1)")
+        parser.add_argument('--preflight', action='store_true',
+                            help="check server, login, modules and language before the update (default in fleet mode)")
+        parser.add_argument('--protocol', choices=list(RPC_BACKENDS), help="overwrite remote call protocol in config file")
+        parser.add_argument('--plan', action='store_true',
+                            help="refresh module list and upgrade only modules with changed version")
+        parser.add_argument('--force', action='store_true', help="with --plan: upgrade all modules, even unchanged")
+        parser.add_argument('--async', dest='async_upgrade', action='store_true',
+                            help="run upgrade as background job on server (patched) and poll its progress")
+        parser.add_argument('--chunk-size', type=int,
+                            help="update translation in chunks of N modules, interrupted update resumes from last chunk")
+        parser.add_argument('--full-translation', action='store_true',
+                            help="update translation of all installed modules, not only modules upgraded in this run")
+        parser.add_argument('--force-translation', action='store_true',
+                            help="load translation files even if they are not changed since the last load (patched server)")
+        parser.add_argument('--metrics', action='store_true', help="export timing of phases and calls to logs/metrics/")
+        parser.add_argument('--prometheus-dir', help="write metrics of run to Prometheus textfile collector directory")
+        parser.add_argument('--collapse', action='store_true',
+                            help="skip modules which are upgraded by a requested module they depend on")
+        parser.add_argument('--resume', action='store_true',
+                            help="skip modules upgraded by the previous interrupted or failed run (logs/journal/)")
+        parser.add_argument('--profile', action='store_true',
+                            help="profile the upgrade and translation load on the server (patched), the report is saved "
+                                 "to logs/profiles/ and the hot spots are printed")
+        parser.add_argument('--profile-top', type=int, help="with --profile: number of top functions in the report")
+        parser.add_argument('--profile-file', action='store_true',
+                            help="with --profile: save the full profile of the server to a .prof file (pstats)")
+        parser.add_argument('--compare-backends', action='store_true',
+                            help="compare payload size and latency of remote call protocols, no module is updated")
+        parser.add_argument('--repeat', type=int, default=3, help="compare backends: number of workload runs")
+        argv = sys.argv[1:]
+        # `python app.py config.json <password>`: a password starting with "-" is not parsed as an option
+        password = None
+        option_strings = {option for action in parser._actions for option in action.option_strings}
+        if len(argv) > 1 and not argv[0].startswith('-') and argv[1].startswith('-') \
+                and argv[1].split('=', 1)[0] not in option_strings:
+            password = argv.pop(1)
+        args = parser.parse_args(argv)
+        if password is not None:
+            args.password = password
+        overrides = {}
+        if args.batch:
+            overrides['batch_update'] = True
+        if args.protocol:
+            overrides['protocol'] = args.protocol
+        if args.plan:
+            overrides['only_changed'] = True
+        if args.force:
+            overrides['force_update'] = True
+        if args.collapse:
+            overrides['collapse_dependencies'] = True
+        if args.async_upgrade:
+            overrides['async_upgrade'] = True
+        if args.chunk_size:
+            overrides['translation_chunk_size'] = args.chunk_size
+        if args.full_translation:
+            overrides['translation_scope'] = 'all'
+        if args.force_translation:
+            overrides['translation_force'] = True
+        if args.metrics:
+            overrides['metrics'] = True
+        if args.prometheus_dir:
+            overrides['prometheus_dir'] = args.prometheus_dir
+        if args.resume:
+            overrides['resume'] = True
+        if args.profile:
+            overrides['profile'] = True
+        if args.profile_top:
+            overrides['profile_top'] = args.profile_top
+        if args.profile_file:
+            overrides['profile_file'] = True
+        if args.serve:
+            # the only positional param is the password
+            serve(args.serve, args.password or args.config, args.per_server, overrides)
+            return
+        if args.fleet:
+            # the only positional param is the password
+            password = args.password or args.config
+            is_ok = run_fleet(args.fleet, password, args.workers, args.per_server, args.per_db, overrides,
+                              preflight_check=args.preflight is not False)
+            sys.exit(0 if is_ok else 1)
+        if not args.config:
+            parser.error("the config file is required")
+        if os.path.isfile(args.config):
+            erp_config = load_config(args.config, args.password)
+            for key, value in overrides.items():
+                setattr(erp_config, key, value)
+            if args.compare_backends:
+                compare_backends(erp_config, args.repeat)
+            elif args.preflight and not preflight_targets([(os.path.basename(args.config), erp_config)])[0]['ok']:
+                sys.exit(1)
+            else:
                 run_update(erp_config)
         else:
             if not color_allow:
-                print("The config file: {} is not found!".format(sys.argv[1]))
+                print("The config file: {} is not found!".format(args.config))
             else:
-                print("The config file: {} is not found!".format(colored(sys.argv[1], 'red')))
+                print("The config file: {} is not found!".format(colored(args.config, 'red')))
 
 
 def gui_mode():
+    import PySimpleGUI as sg
+
+    language_options = ["vi_VN (Vietnamese)", "en_US (English)", "fr_FR (French)", "es_ES (Spanish)",
+                        "zh_CN (Chinese (Simplified))"]
+
     config_update = [
         [
             sg.Text("Config file", size=(15, 1)),
@@ -332,11 +2784,12 @@ def gui_mode():
         ],
         [
             sg.Text("Lang.(s) to update", size=(15, 1)),
-            sg.OptionMenu(size=(20, 1),
-                          values=("", "vi_VN (Vietnamese)", "en_US (English)", "fr_FR (French)",
-                                  "es_ES (Spanish)", "zh_CN (Chinese (Simplified))"),
-                          key='-LANGUAGE-')
-            # sg.Multiline(size=(25, 4), key='-LANGUAGES-', default_text="vi_VN")
+            # select many languages with click (or Ctrl + click)
+            sg.Listbox(size=(23, 4), values=language_options, select_mode=sg.LISTBOX_SELECT_MODE_MULTIPLE,
+                       key='-LANGUAGE-')
+        ],
+        [
+            sg.Checkbox(text='Full translation refresh', key='-FULL-TRANS-', default=False)
         ],
         [
             sg.Text('Admin password', size=(15, 1)),
@@ -348,6 +2801,24 @@ def gui_mode():
                           values=(0, 30, 60, 120, 180, 300, 600, 900, 1800, 3600), default_value=0,
                           key='-WAITING-TIME-')
         ],
+        [
+            sg.Checkbox(text='Batch update (one reload)', key='-BATCH-', default=False)
+        ],
+        [
+            sg.Checkbox(text='Skip unchanged modules', key='-ONLY-CHANGED-', default=False)
+        ],
+        [
+            sg.Checkbox(text='Collapse dependent modules', key='-COLLAPSE-', default=False)
+        ],
+        [
+            sg.Checkbox(text='Upgrade as server job', key='-ASYNC-', default=False)
+        ],
+        [
+            sg.Checkbox(text='Resume interrupted run', key='-RESUME-', default=False)
+        ],
+        [
+            sg.Checkbox(text='Profile on server (patched)', key='-PROFILE-', default=False)
+        ],
         [
             sg.Checkbox(text='Play sound when done', key='-PLAY-DONE-', default=True)
         ],
@@ -359,7 +2830,7 @@ def gui_mode():
     log_status = [
         [
             sg.Text("Status"),
-            sg.Multiline(size=(50, 14), key='-STATUS-', disabled=True, autoscroll=True, auto_refresh=True)
+            sg.Multiline(size=(50, 14), key='-STATUS-', disabled=True, autoscroll=True)
         ]
     ]
     layout = [
@@ -374,170 +2845,213 @@ def gui_mode():
                        margins=(15, 15))
     window.set_icon(resource_path('resources/icon.ico'))
 
+    # status output is queued and printed by the GUI thread in batch
+    status_queue = queue.Queue()
+    status_notified = threading.Event()
+    main_thread = threading.current_thread()
+    cancel_event = threading.Event()
+    worker = None
+
     def update_status(text: str, clear: bool = False, sep="\n", font: str = None, text_color: str = None):
-        global is_exit
-        if is_exit:
-            return
-        if not clear:
-            window['-STATUS-'].print(text, end=sep, font=font, text_color=text_color)
-        else:
-            window['-STATUS-'].update("")
-            window['-STATUS-'].print(text, end=sep, font=font, text_color=text_color)
+        status_queue.put((text, clear, sep, font, text_color))
+        if threading.current_thread() is not main_thread and not status_notified.is_set():
+            # wake up the GUI thread one time for all status queued until it is flushed
+            status_notified.set()
+            window.write_event_value('-STATUS-FLUSH-', None)
 
-    def read_event():
-        global event, values, is_cancel, is_running, is_exit
+    def flush_status():
+        status_notified.clear()
+        status = window['-STATUS-']
         while True:
-            event, values = window.read()
-            if event == '-BTN-CANCEL-' and is_running:
-                is_cancel = True
-            if event == sg.WIN_CLOSED:
-                is_exit = True
-                is_cancel = True
+            try:
+                text, clear, sep, font, text_color = status_queue.get_nowait()
+            except queue.Empty:
                 break
+            if clear:
+                status.update("")
+            status.print(text, end=sep, font=font, text_color=text_color)
+
+    def show_config(config_file: str):
+        update_status("---")
+        update_status("Config file: ", sep="", font="arial 9 bold")
+        update_status(config_file if config_file else '')
+        if not config_file or not os.path.isfile(config_file):
+            return
+        with open(config_file, 'r') as f:
+            try:
+                config = json.load(f)
+                if 'modules_to_update' in config and not values['-MODULES-']:
+                    window['-MODULES-'].update("\n".join(config['modules_to_update']))
+                if 'batch_update' in config:
+                    window['-BATCH-'].update(bool(config['batch_update']))
+                if 'only_changed' in config:
+                    window['-ONLY-CHANGED-'].update(bool(config['only_changed']))
+                if 'collapse_dependencies' in config:
+                    window['-COLLAPSE-'].update(bool(config['collapse_dependencies']))
+                if 'async_upgrade' in config:
+                    window['-ASYNC-'].update(bool(config['async_upgrade']))
+                if 'resume' in config:
+                    window['-RESUME-'].update(bool(config['resume']))
+                if 'profile' in config:
+                    window['-PROFILE-'].update(bool(config['profile']))
+                if 'translation_scope' in config:
+                    window['-FULL-TRANS-'].update(config['translation_scope'] == 'all')
+                codes = language_codes(config.get('language_to_update'))
+                if codes and not values['-LANGUAGE-']:
+                    # languages of config not in the list are added as code only
+                    options = language_options + [code for code in codes if code not in language_codes(language_options)]
+                    window['-LANGUAGE-'].update(values=options, set_to_index=[
+                        index for index, option in enumerate(options) if language_code(option) in codes])
+                update_status("  - ERP server: ", font="Consolas 9", sep="")
+                update_status(config['url'], font="Consolas 9 bold")
+                update_status("  - Database: ", font="Consolas 9", sep="")
+                update_status(config['db'], font="Consolas 9 bold")
+                update_status("  - Username: ", font="Consolas 9", sep="")
+                update_status(config['username'], font="Consolas 9 bold")
+                update_status("  - Password: ", font="Consolas 9", sep="")
+                if config['password']:
+                    if config['password'].startswith('gAAAAA'):
+                        update_status("YES (encrypted)", font="Consolas 9 bold", text_color="green")
+                    else:
+                        update_status("YES", font="Consolas 9 bold", text_color="green")
+                else:
+                    update_status("NO", font="Consolas 9 bold", text_color="red")
+            except Exception:
+                update_status(f"---\nError: Cannot read config file {config_file}\nError logs:\n{traceback.format_exc()}")
 
-    th_read_event = threading.Thread(target=read_event, daemon=True)
-    th_read_event.start()
+    def prepare_run():
+        """ Validate input and create config to run, return (config, waiting time, play sound) or None """
+        config_file = values['-CF-FILE-']
+        modules = values['-MODULES-']
+        language = language_codes(values['-LANGUAGE-'])
+        admin_pwd = values['-ADMIN-PWD-']
+        waiting_time = values['-WAITING-TIME-']
+        waiting_time = int(waiting_time) if waiting_time else 0
+        play_sound = values['-PLAY-DONE-']
+        if not config_file:
+            update_status('Please select a config file...', clear=True)
+            return None
+        if not (modules or language):
+            update_status('Please input modules name (one per line) or language to update!', clear=True)
+            return None
+        if not os.path.isfile(config_file):
+            update_status(f"=== ERROR ===", clear=True, font="arial 9 bold")
+            update_status(f"The config file ", sep="")
+            update_status(config_file, font="arial 9 bold")
+            update_status(" is not exist!")
+            if play_sound:
+                play_audio(True)
+            return None
+        allow_run = True
+        with open(config_file, 'r') as f:
+            try:
+                config = json.load(f)
+                if config['password'].startswith('gAAAAA'):
+                    if os.getenv(FERNET_KEY, ''):
+                        config['password'] = decrypt_password(config['password'])
+                    else:
+                        update_status("---\nWarning: ", font="arial 9 bold", sep="")
+                        update_status("Cannot find Fernet key in current environment")
+                erp_config = Config(**config)
+                erp_config.modules_to_update = []
+                erp_config.config_file = config_file
+                erp_config.batch_update = values['-BATCH-']
+                erp_config.only_changed = values['-ONLY-CHANGED-']
+                erp_config.collapse_dependencies = values['-COLLAPSE-']
+                erp_config.async_upgrade = values['-ASYNC-']
+                erp_config.resume = values['-RESUME-']
+                erp_config.profile = values['-PROFILE-']
+                if modules:
+                    for item in modules.splitlines():
+                        if item.strip():
+                            erp_config.modules_to_update.append(item.strip())
+                    if not erp_config.url or not erp_config.db:
+                        update_status("---\nError: ", font="arial 9 bold", sep="")
+                        update_status("Missing config for remote server URL and/or database name")
+                        allow_run = False
+                    if not erp_config.modules_to_update and allow_run:
+                        update_status("---\nError: ", font="arial 9 bold", sep="")
+                        update_status("Please input module(s) to update")
+                        allow_run = False
+                if language:
+                    erp_config.language_to_update = language
+                    erp_config.translation_scope = 'all' if values['-FULL-TRANS-'] else 'upgraded'
+                    allow_run = True
+            except Exception:
+                update_status("---\nError: ", font="arial 9 bold", sep="")
+                update_status(f"Reading config file failed!")
+                update_status(f"Error logs:", font="arial 9 bold")
+                update_status(f"{traceback.format_exc()}", font="Consolas 9")
+                if play_sound:
+                    play_audio(True)
+                return None
+        if not allow_run:
+            return None
+        if admin_pwd:
+            erp_config.password = admin_pwd
+            update_status("- Auth using password is set from input")
+        return erp_config, waiting_time, play_sound
 
-    current_cf_file = None
+    def run_worker(erp_config: Config, waiting_time: int, play_sound: bool):
+        """ Run update in background, status is sent to the GUI thread, cancel is checked between modules """
+        try:
+            if waiting_time:
+                update_status(f"Wait for {waiting_time} seconds...")
+                i = 0
+                while i < waiting_time and not cancel_event.wait(1):
+                    i += 1
+                    if not i % 5:
+                        update_status(f"Time wait remain: {waiting_time - i} seconds...")
+            if cancel_event.is_set():
+                update_status('=== CANCEL ===', font="arial 9 bold")
+                return
+            update_status("=== UPDATE START ===", clear=True, font="arial 9 bold")
+            try:
+                is_ok = run_update(erp_config, update_status, True, cancel_event=cancel_event)
+                update_status("=== UPDATE END ===", font="arial 9 bold")
+                if play_sound:
+                    play_audio(is_error=not is_ok)
+            except Exception:
+                log_text = traceback.format_exc()
+                log_file = log_to_file(log_text, config_file=erp_config.config_file)
+                update_status(f"\n---")
+                update_status("Error: ", font="arial 9 bold", sep="")
+                update_status("The update request error, shorten logs:")
+                update_status(f"{log_text[:100]}\n...\n...{log_text[-100:]}", font="Consolas 9")
+                update_status("Log file: ", font="arial 9 bold", sep="")
+                update_status(log_file)
+                update_status("=== UPDATE END ===", font="arial 9 bold")
+                if play_sound:
+                    play_audio(True)
+        finally:
+            window.write_event_value('-RUN-DONE-', None)
 
     while True:
-        global event, values, is_cancel, is_running, is_exit
-        # event, values = window.read()
-        # if event == sg.WIN_CLOSED:
-        #     break
-        time.sleep(.001)
-        if is_exit:
+        event, values = window.read()
+        if event == sg.WIN_CLOSED:
+            cancel_event.set()
             break
-        if values:
-            if current_cf_file != values['-CF-FILE-']:
-                current_cf_file = values['-CF-FILE-']
-                update_status("---")
-                update_status("Config file: ", sep="", font="arial 9 bold")
-                update_status(current_cf_file if current_cf_file else '')
-                if current_cf_file:
-                    with open(current_cf_file, 'r') as f:
-                        try:
-                            config = json.load(f)
-                            if 'modules_to_update' in config and not values['-MODULES-']:
-                                window['-MODULES-'].update("\n".join(config['modules_to_update']))
-                            update_status("  - ERP server: ", font="Consolas 9", sep="")
-                            update_status(config['url'], font="Consolas 9 bold")
-                            update_status("  - Database: ", font="Consolas 9", sep="")
-                            update_status(config['db'], font="Consolas 9 bold")
-                            update_status("  - Username: ", font="Consolas 9", sep="")
-                            update_status(config['username'], font="Consolas 9 bold")
-                            update_status("  - Password: ", font="Consolas 9", sep="")
-                            if config['password']:
-                                if config['password'].startswith('gAAAAA'):
-                                    update_status("YES (encrypted)", font="Consolas 9 bold", text_color="green")
-                                else:
-                                    update_status("YES", font="Consolas 9 bold", text_color="green")
-                            else:
-                                update_status("NO", font="Consolas 9 bold", text_color="red")
-                        except Exception:
-                            update_status(f"---\nError: Cannot read config file {current_cf_file}\nError logs:\n{traceback.format_exc()}")
-
-        if event == '-BTN-RUN-':
-            if not is_running:
-                is_running = True
-            else:
-                return
-            config_file = values['-CF-FILE-']
-            modules = values['-MODULES-']
-            language = values['-LANGUAGE-']
-            admin_pwd = values['-ADMIN-PWD-']
-            waiting_time = values['-WAITING-TIME-']
-            waiting_time = int(waiting_time) if waiting_time else 0
-            play_sound = values['-PLAY-DONE-']
-            if config_file and (modules or language):
-                if os.path.isfile(config_file):
-                    allow_run = True
-                    with open(config_file, 'r') as f:
-                        try:
-                            config = json.load(f)
-                            if config['password'].startswith('gAAAAA'):
-                                if os.getenv(FERNET_KEY, ''):
-                                    fernet = Fernet(os.getenv(FERNET_KEY).encode())
-                                    config['password'] = fernet.decrypt(config['password'].encode()).decode()
-                                else:
-                                    update_status("---\nWarning: ", font="arial 9 bold", sep="")
-                                    update_status("Cannot find Fernet key in current environment")
-                            erp_config = Config(**config)
-                            erp_config.modules_to_update = []
-                            erp_config.config_file = current_cf_file
-                            if modules:
-                                for item in modules.splitlines():
-                                    if item.strip():
-                                        erp_config.modules_to_update.append(item.strip())
-                                if not erp_config.url or not erp_config.db:
-                                    update_status("---\nError: ", font="arial 9 bold", sep="")
-                                    update_status("Missing config for remote server URL and/or database name")
-                                    allow_run = False
-                                if not erp_config.modules_to_update and allow_run:
-                                    update_status("---\nError: ", font="arial 9 bold", sep="")
-                                    update_status("Please input module(s) to update")
-                                    allow_run = False
-                            if language:
-                                erp_config.language_to_update = language
-                                allow_run = True
-                        except Exception:
-                            allow_run = False
-                            update_status("---\nError: ", font="arial 9 bold", sep="")
-                            update_status(f"Reading config file failed!")
-                            update_status(f"Error logs:", font="arial 9 bold")
-                            update_status(f"{traceback.format_exc()}", font="Consolas 9")
-                            if play_sound:
-                                play_audio(True)
-                    if allow_run:
-                        if admin_pwd:
-                            erp_config.password = admin_pwd
-                            update_status("- Auth using password is set from input")
-                        if waiting_time:
-                            update_status(f"Wait for {waiting_time} seconds...")
-                            i = 0
-                            while i < waiting_time and not is_cancel:
-                                i += 1
-                                time.sleep(1)
-                                window.refresh()
-                                if not i % 5:
-                                    update_status(f"Time wait remain: {waiting_time - i} seconds...")
-                        if is_cancel:
-                            update_status('=== CANCEL ===', font="arial 9 bold")
-                            is_cancel = False
-                        else:
-                            update_status("=== UPDATE START ===", clear=True, font="arial 9 bold")
-                            try:
-                                is_ok = run_update(erp_config, update_status, True)
-                                update_status("=== UPDATE END ===", font="arial 9 bold")
-                                if play_sound:
-                                    play_audio(is_error=not is_ok)
-                            except Exception:
-                                log_text = traceback.format_exc()
-                                log_file = log_to_file(log_text, config_file=current_cf_file)
-                                update_status(f"\n---")
-                                update_status("Error: ", font="arial 9 bold", sep="")
-                                update_status("The update request error, shorten logs:")
-                                update_status(f"{log_text[:100]}\n...\n...{log_text[-100:]}", font="Consolas 9")
-                                update_status("Log file: ", font="arial 9 bold", sep="")
-                                update_status(log_file)
-                                update_status("=== UPDATE END ===", font="arial 9 bold")
-                                if play_sound:
-                                    play_audio(True)
-                else:
-                    update_status(f"=== ERROR ===", clear=True, font="arial 9 bold")
-                    update_status(f"The config file ", sep="")
-                    update_status(config_file, font="arial 9 bold")
-                    update_status(" is not exist!")
-                    if play_sound:
-                        play_audio(True)
+        if event == '-CF-FILE-':
+            show_config(values['-CF-FILE-'])
+        elif event == '-BTN-RUN-':
+            if worker is not None:
+                update_status("The update is running, press Cancel to stop it")
             else:
-                if not config_file:
-                    update_status('Please select a config file...', clear=True)
-                elif not modules:
-                    update_status('Please input modules name (one per line) or language to update!', clear=True)
-            is_running = False
-        if event != sg.WIN_CLOSED:
-            event = INIT_STATE_EVENT
+                run_args = prepare_run()
+                if run_args:
+                    cancel_event.clear()
+                    window['-BTN-RUN-'].update(disabled=True)
+                    worker = threading.Thread(target=run_worker, args=run_args, daemon=True)
+                    worker.start()
+        elif event == '-BTN-CANCEL-':
+            if worker is not None and not cancel_event.is_set():
+                cancel_event.set()
+                update_status("Cancelling, the update stops before the next module...", font="arial 9 bold")
+        elif event == '-RUN-DONE-':
+            worker = None
+            window['-BTN-RUN-'].update(disabled=False)
+        flush_status()
+    window.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,328 @@
+"""
+Fake Odoo server for benchmark, implement the remote calls used by `app.py` on XML-RPC (/xmlrpc/2/common,
+/xmlrpc/2/object) and JSON-RPC (/jsonrpc) with configurable network latency, upgrade duration and faults.
+
+Run standalone: python benchmark/fake_odoo.py --port 8069 --modules 100 --latency 0.01 --reload-time 0.5
+Statistics: GET /stats return number of calls (per method) since start or since POST /reset
+"""
+import argparse
+import base64
+import json
+import marshal
+import random
+import threading
+import time
+import xmlrpc.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SERVER_VERSION = '16.0'
+BUSY_MESSAGE = "The server is busy right now, module operations are not possible at this time, please try again later."
+
+
+class FakeOdoo:
+    """ State and behavior of the fake server, one set of modules per database (created on first access) """
+
+    def __init__(self, modules: int = 100, latency: float = 0.0, reload_time: float = 0.1,
+                 module_time: float = 0.01, busy_rate: float = 0.0, fail_rate: float = 0.0, fault_size: int = 0,
+                 changed_rate: float = 0.0, patched: bool = False, password: str = 'admin', seed: int = 0):
+        self.modules = modules
+        self.latency = latency
+        self.reload_time = reload_time
+        self.module_time = module_time
+        self.busy_rate = busy_rate
+        self.fail_rate = fail_rate
+        self.fault_size = fault_size
+        self.changed_rate = changed_rate
+        self.patched = patched
+        self.password = password
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.databases = {}
+        self.upgrade_locks = {}
+        # (module id, language) of translations loaded, the translation files never change on the fake server
+        self.translations = {}
+        self.stats = {}
+
+    def reset(self):
+        with self.lock:
+            self.databases = {}
+            self.stats = {}
+
+    def count(self, key: str):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def database(self, db: str) -> dict:
+        with self.lock:
+            if db not in self.databases:
+                self.translations[db] = set()
+                # module_<n> depends on base and module_<n // 10> to have a few levels of dependency
+                modules = {1: {'id': 1, 'name': 'base', 'depends': []}}
+                for i in range(1, self.modules + 1):
+                    modules[i + 1] = {'id': i + 1, 'name': f'module_{i}',
+                                      'depends': ['base'] + ([f'module_{i // 10}'] if i >= 10 else [])}
+                for module in modules.values():
+                    module.update(state='installed', shortdesc=module['name'].title(), latest_version='16.0.1.0',
+                                  installed_version='16.0.1.1' if self.random.random() < self.changed_rate else '16.0.1.0')
+                self.databases[db] = modules
+                self.upgrade_locks[db] = threading.Lock()
+            return self.databases[db]
+
+    def fault(self, message: str, code: int = 1):
+        traceback_text = "Traceback (most recent call last):\n" + '  File "odoo/fake.py", line 1, in upgrade\n' * self.fault_size
+        return xmlrpc.client.Fault(code, f"{traceback_text}{message}")
+
+    @staticmethod
+    def match(record: dict, domain: list) -> bool:
+        for field, operator, value in domain:
+            field_value = record.get(field.split('.')[-1])
+            if operator == '=' and field_value != value:
+                return False
+            if operator == 'in' and field_value not in value:
+                return False
+        return True
+
+    def version(self) -> dict:
+        return {'server_version': SERVER_VERSION, 'server_version_info': [16, 0, 0, 'final', 0, ''],
+                'server_serie': SERVER_VERSION, 'protocol_version': 1}
+
+    def authenticate(self, db: str, username: str, password: str, user_agent_env: dict):
+        self.database(db)
+        return 2 if password == self.password else False
+
+    def execute_kw(self, db: str, uid: int, password: str, model: str, method: str, args: list, kwargs: dict = None):
+        kwargs = kwargs or {}
+        self.count(f"{model}.{method}")
+        if password != self.password:
+            raise xmlrpc.client.Fault(3, 'Access Denied')
+        modules = self.database(db)
+        fields = kwargs.get('fields')
+
+        def read(records: list) -> list:
+            return [{key: rec[key] for key in ['id'] + (fields or ['name', 'state'])} for rec in records]
+
+        if model == 'ir.module.module':
+            if method == 'search':
+                return [rec['id'] for rec in modules.values() if self.match(rec, args[0])]
+            if method == 'search_read':
+                return read([rec for rec in modules.values() if self.match(rec, args[0])])
+            if method == 'read':
+                fields = fields or (args[1] if len(args) > 1 else None)
+                return read([modules[mod_id] for mod_id in args[0] if mod_id in modules])
+            if method == 'update_list':
+                return [0, 0]
+            if method == 'button_immediate_upgrade':
+                return self.upgrade(db, args[0])
+            if method == 'remote_patch_info' and self.patched:
+                return {'version': 4, 'features': ['remote_update_translation', 'remote_upgrade_modules',
+                                                   'translation_checksum', 'translation_languages', 'profile']}
+            if method == 'remote_upgrade_modules' and self.patched:
+                return dict(self.upgrade_report(db, args[0]), profile=self.profile(kwargs, len(args[0])))
+            if method == 'remote_update_translation' and self.patched:
+                return dict(self.update_translation(db, args[0], kwargs.get('filter_lang'), kwargs.get('force', False)),
+                            profile=self.profile(kwargs, len(args[0])))
+            if method in ('remote_update_translation', 'update_translations'):
+                time.sleep(self.module_time * len(args[0]))
+                if method == 'update_translations':
+                    raise xmlrpc.client.Fault(1, "cannot marshal None unless allow_none is enabled")
+                return {'status': True, 'error': '', 'modules': len(args[0]), 'duration': self.module_time * len(args[0])}
+        if model == 'ir.module.module.dependency' and method == 'search_read':
+            by_name = {rec['name']: rec for rec in modules.values()}
+            result, dependency_id = [], 0
+            for rec in modules.values():
+                for name in rec['depends']:
+                    dependency_id += 1
+                    result.append({'id': dependency_id, 'name': name, 'module_id': [rec['id'], rec['shortdesc']],
+                                   'depend_id': [by_name[name]['id'], by_name[name]['shortdesc']]})
+            return result
+        if model == 'res.lang':
+            languages = [{'id': 1, 'code': 'en_US', 'name': 'English (US)', 'active': True},
+                         {'id': 2, 'code': 'vi_VN', 'name': 'Vietnamese', 'active': True},
+                         {'id': 3, 'code': 'fr_FR', 'name': 'French', 'active': True}]
+            languages = [lang for lang in languages if self.match(lang, args[0])]
+            if method == 'search':
+                return [lang['id'] for lang in languages]
+            return [{key: lang[key] for key in ['id'] + (fields or list(lang))} for lang in languages]
+        raise xmlrpc.client.Fault(2, f"AttributeError: type object '{model}' has no attribute '{method}'")
+
+    def upgrade(self, db: str, ids: list) -> dict:
+        modules = self.database(db)
+        upgrade_lock = self.upgrade_locks[db]
+        if not upgrade_lock.acquire(blocking=False):
+            # another upgrade is running on the database
+            raise self.fault(BUSY_MESSAGE)
+        try:
+            if self.random.random() < self.busy_rate:
+                raise self.fault(BUSY_MESSAGE)
+            # one registry reload for the call and loading time of each module
+            time.sleep(self.reload_time + self.module_time * len(ids))
+            if self.random.random() < self.fail_rate:
+                raise self.fault("odoo.exceptions.ValidationError: fake upgrade error")
+            for mod_id in ids:
+                modules[mod_id]['latest_version'] = modules[mod_id]['installed_version']
+            return {'type': 'ir.actions.client', 'tag': 'reload'}
+        finally:
+            upgrade_lock.release()
+
+
+    def update_translation(self, db: str, ids: list, filter_lang, force: bool) -> dict:
+        """
+        Response of patch function `remote_update_translation` with skip of unchanged translation files, the languages
+        of a module are loaded in one visit: one module time and a quarter of module time for each other language
+        """
+        modules = self.database(db)
+        langs = [filter_lang] if isinstance(filter_lang, str) else list(filter_lang)
+        languages = {}
+        for lang in langs:
+            loaded = [mod_id for mod_id in ids if force or (mod_id, lang) not in self.translations[db]]
+            languages[lang] = {'loaded': [modules[mod_id]['name'] for mod_id in loaded],
+                               'skipped': [modules[mod_id]['name'] for mod_id in ids if mod_id not in loaded]}
+            self.translations[db].update((mod_id, lang) for mod_id in loaded)
+        visits = {name: sum(name in result['loaded'] for result in languages.values()) for name in
+                  (modules[mod_id]['name'] for mod_id in ids)}
+        duration = sum(self.module_time * (1 + (count - 1) / 4) for count in visits.values() if count)
+        time.sleep(duration)
+        for result in languages.values():
+            share = sum(self.module_time * (1 + (visits[name] - 1) / 4) / visits[name] for name in result['loaded'])
+            result.update(duration=share, saved=self.module_time * len(result['skipped']))
+        loaded = [name for name, count in visits.items() if count]
+        return {'status': True, 'error': '', 'modules': len(ids), 'duration': duration, 'loaded': loaded,
+                'skipped': [name for name, count in visits.items() if not count],
+                'saved': sum(result['saved'] for result in languages.values()), 'languages': languages}
+
+    def profile(self, kwargs: dict, modules: int) -> dict:
+        """ Profile report of patch functions (`profile` param), the functions and times are made up """
+        if not kwargs.get('profile'):
+            return {}
+        stats = {
+            ('odoo/models.py', 4000, '_compute_fake_total'): (modules, modules, self.module_time * modules * 0.6,
+                                                              self.module_time * modules * 0.7, {}),
+            ('odoo/sql_db.py', 300, 'execute'): (modules * 50, modules * 50, self.module_time * modules * 0.3,
+                                                 self.module_time * modules * 0.3, {}),
+        }
+        rows = [{'function': f"{file_name}:{line}({name})", 'calls': calls, 'tottime': tottime, 'cumtime': cumtime}
+                for (file_name, line, name), (_, calls, tottime, cumtime, _) in stats.items()]
+        return {'duration': self.module_time * modules, 'queries': modules * 50, 'error': '',
+                'total_calls': sum(row['calls'] for row in rows), 'functions': rows[:kwargs.get('profile_top', 20)],
+                'cumulative': rows[:kwargs.get('profile_top', 20)],
+                'profile_data': base64.b64encode(marshal.dumps(stats)).decode() if kwargs.get('profile_file') else ''}
+
+    def upgrade_report(self, db: str, names: list) -> dict:
+        """ Response of patch function `remote_upgrade_modules` """
+        modules = {rec['name']: rec for rec in self.database(db).values()}
+        installed = [modules[name] for name in names if name in modules and modules[name]['state'] == 'installed']
+        report = {'status': False, 'result': {}, 'error': '', 'traceback': '', 'duration': 0.0, 'errors': [],
+                  'missing': [name for name in names if name not in modules], 'modules': {},
+                  'not_installed': {name: modules[name]['state'] for name in names
+                                    if name in modules and modules[name]['state'] != 'installed'}}
+        start_time = time.time()
+        try:
+            report['result'] = self.upgrade(db, [rec['id'] for rec in installed])
+            report['status'] = True
+        except xmlrpc.client.Fault as e:
+            report['error'] = e.faultString.splitlines()[-1]
+            report['traceback'] = e.faultString
+        report['duration'] = time.time() - start_time
+        for rec in installed if report['status'] else []:
+            report['modules'][rec['name']] = {
+                'requested': True, 'state': rec['state'], 'latest_version': rec['latest_version'],
+                'duration': self.module_time, 'data_file_count': 2, 'records': 10, 'queries': 50, 'errors': [],
+                'data_files': [{'file': 'security/ir.model.access.csv', 'duration': self.module_time / 4},
+                               {'file': 'views/views.xml', 'duration': self.module_time / 2}],
+            }
+        return report
+
+
+class FakeOdooHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeOdoo'
+    # headers and body are written separately, avoid delayed ACK on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self.send_body(json.dumps(self.server.odoo.stats).encode(), 'application/json')
+        self.send_error(404)
+
+    def do_POST(self):
+        odoo = self.server.odoo
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = xmlrpc.client.gzip_decode(body, max_decode=-1)
+        if self.path == '/reset':
+            odoo.reset()
+            return self.send_body(b'{}', 'application/json')
+        time.sleep(odoo.latency)
+        odoo.count('requests')
+        if self.path in ('/xmlrpc/2/common', '/xmlrpc/2/object'):
+            try:
+                params, method = xmlrpc.client.loads(body, use_builtin_types=True)
+                result = (getattr(odoo, method)(*params),)
+                response = xmlrpc.client.dumps(result, methodresponse=True, allow_none=False)
+            except xmlrpc.client.Fault as e:
+                response = xmlrpc.client.dumps(e, allow_none=True)
+            return self.send_body(response.encode(), 'text/xml')
+        if self.path == '/jsonrpc':
+            request = json.loads(body)
+            params = request['params']
+            try:
+                result = {'result': getattr(odoo, params['method'])(*params['args'])}
+            except xmlrpc.client.Fault as e:
+                result = {'error': {'code': 200, 'message': 'Odoo Server Error',
+                                    'data': {'name': 'odoo.exceptions.UserError', 'message': e.faultString.splitlines()[-1],
+                                             'debug': e.faultString}}}
+            response = dict(result, jsonrpc='2.0', id=request.get('id'))
+            return self.send_body(json.dumps(response).encode(), 'application/json')
+        self.send_error(404)
+
+
+def start_server(host: str = '127.0.0.1', port: int = 0, **options) -> ThreadingHTTPServer:
+    """ Start fake server in a thread, port 0 to use a free port: `server.server_address` """
+    server = ThreadingHTTPServer((host, port), FakeOdooHandler)
+    server.daemon_threads = True
+    server.odoo = FakeOdoo(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=0.002, help="network latency of each request (seconds)")
+    parser.add_argument('--reload-time', type=float, default=0.05, help="registry reload time of each upgrade (seconds)")
+    parser.add_argument('--module-time', type=float, default=0.002, help="load time of each module (seconds)")
+    parser.add_argument('--busy-rate', type=float, default=0.0, help="probability of 'server is busy' fault on upgrade")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="probability of upgrade error")
+    parser.add_argument('--fault-size', type=int, default=0, help="number of traceback lines in faults")
+    parser.add_argument('--changed-rate', type=float, default=1.0, help="rate of modules have a new version")
+    parser.add_argument('--patched', action='store_true',
+                        help="support patch functions: remote_upgrade_modules, translation checksum")
+
+
+def server_options(args) -> dict:
+    return {'latency': args.latency, 'reload_time': args.reload_time, 'module_time': args.module_time,
+            'busy_rate': args.busy_rate, 'fail_rate': args.fail_rate, 'fault_size': args.fault_size,
+            'changed_rate': args.changed_rate, 'patched': args.patched}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Fake Odoo server for benchmark")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8069)
+    arg_parser.add_argument('--modules', type=int, default=100, help="number of modules in each database")
+    add_server_arguments(arg_parser)
+    arguments = arg_parser.parse_args()
+    fake_server = start_server(arguments.host, arguments.port, modules=arguments.modules, **server_options(arguments))
+    print(f"Fake Odoo server: http://{arguments.host}:{fake_server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake_server.shutdown()
@@ -0,0 +1,126 @@
+"""
+Benchmark `run_update` of `app.py` against the fake Odoo server (`benchmark/fake_odoo.py`), report wall time, number of
+remote calls and peak memory of the client for each mode, number of modules and number of databases:
+
+* serial: upgrade modules one by one, databases one after another
+* batch: upgrade all modules in one request, databases one after another
+* concurrent: upgrade all modules in one request, databases in parallel (`--workers`)
+
+Example: python benchmark/run_benchmark.py --modules 1,10,100,500 --databases 1,10,50 --modes batch,concurrent
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+import app  # noqa: E402
+from fake_odoo import add_server_arguments, server_options  # noqa: E402
+
+MODES = ('serial', 'batch', 'concurrent')
+
+
+def start_fake_server(args, modules: int):
+    """ Start fake server in another process, the memory of the server is not counted in the client """
+    command = [sys.executable, os.path.join(bench_dir, 'fake_odoo.py'), '--port', '0', '--modules', str(modules)]
+    for key, value in server_options(args).items():
+        if isinstance(value, bool):
+            command += [f"--{key.replace('_', '-')}"] if value else []
+        else:
+            command += [f"--{key.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().split(': ', 1)[1].strip()
+    return process, url
+
+
+def server_request(url: str, path: str, data: bytes = None) -> dict:
+    with urllib.request.urlopen(url + path, data=data) as response:
+        return json.loads(response.read())
+
+
+def run_scenario(url: str, mode: str, modules: int, databases: int, args) -> dict:
+    configs = []
+    for i in range(databases):
+        cf = app.Config(url, f"bench_{i + 1}", 'admin', [f"module_{n + 1}" for n in range(modules)])
+        cf.config_file = f"bench_{i + 1}.json"
+        cf.batch_update = mode != 'serial'
+        cf.protocol = args.protocol
+        cf.language_to_update = args.lang
+        configs.append(cf)
+
+    def run_one(cf: app.Config) -> bool:
+        try:
+            return bool(app.run_update(cf, lambda *a, **k: None, interactive=False))
+        except Exception:
+            return False
+
+    server_request(url, '/reset', b'')
+    app.connection_pool.clear()
+    if args.memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    if mode == 'concurrent':
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(run_one, configs))
+    else:
+        results = [run_one(cf) for cf in configs]
+    wall_time = time.perf_counter() - start_time
+    peak_memory = 0
+    if args.memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    stats = server_request(url, '/stats')
+    # patched server (--patched) upgrades by remote_upgrade_modules
+    upgrade_calls = (stats.get('ir.module.module.button_immediate_upgrade', 0)
+                     + stats.get('ir.module.module.remote_upgrade_modules', 0))
+    return {
+        'mode': mode, 'modules': modules, 'databases': databases, 'wall_time': wall_time,
+        'rpc_calls': stats.get('requests', 0), 'upgrade_calls': upgrade_calls,
+        'ok': sum(results), 'peak_memory_kib': peak_memory / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run_update against fake Odoo server")
+    parser.add_argument('--modes', default=','.join(MODES), help="comma separated modes: " + ', '.join(MODES))
+    parser.add_argument('--modules', default='1,10,100', help="comma separated numbers of modules to update")
+    parser.add_argument('--databases', default='1,10', help="comma separated numbers of databases")
+    parser.add_argument('--workers', type=int, default=8, help="concurrent mode: number of databases run in parallel")
+    parser.add_argument('--protocol', choices=list(app.RPC_BACKENDS), default='xmlrpc')
+    parser.add_argument('--lang', default='', help="comma separated language codes to update translation, ex: vi_VN,fr_FR")
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="do not trace memory (tracemalloc slows down the client)")
+    parser.add_argument('--json', help="write results to JSON file")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    module_counts = [int(n) for n in args.modules.split(',')]
+    database_counts = [int(n) for n in args.databases.split(',')]
+
+    process, url = start_fake_server(args, max(module_counts))
+    rows = []
+    try:
+        print(f"{'mode':<12}{'modules':>8}{'dbs':>6}{'wall (s)':>10}{'rpc':>8}{'upgrades':>10}{'ok':>6}{'peak mem (KiB)':>16}")
+        for databases in database_counts:
+            for modules in module_counts:
+                for mode in modes:
+                    row = run_scenario(url, mode, modules, databases, args)
+                    rows.append(row)
+                    print(f"{row['mode']:<12}{row['modules']:>8}{row['databases']:>6}{row['wall_time']:>10.2f}"
+                          f"{row['rpc_calls']:>8}{row['upgrade_calls']:>10}{row['ok']:>6}{row['peak_memory_kib']:>16.0f}")
+    finally:
+        process.terminate()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'server': server_options(args), 'protocol': args.protocol, 'results': rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
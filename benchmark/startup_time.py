@@ -0,0 +1,75 @@
+"""
+Benchmark startup time of the console mode of `app.py`: time of `import app` and `python app.py --help` in new
+processes, the modules of GUI, audio and crypto stacks loaded by the import, and the import time of each stack (the
+time saved in console mode when the stack is not imported).
+
+Example: python benchmark/startup_time.py --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+app_dir = os.path.dirname(bench_dir)
+
+# stacks are imported only when used: GUI mode, sound when done, encrypted password
+LAZY_STACKS = {'gui': 'PySimpleGUI', 'audio': 'pyaudio', 'crypto': 'cryptography.fernet'}
+
+
+def run_times(command: list, repeat: int):
+    """ :return: list of run times, or None if the command failed (ex: the stack is not installed) """
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = subprocess.run(command, cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if result.returncode != 0:
+            return None
+        times.append(time.perf_counter() - start_time)
+    return times
+
+
+def loaded_stacks() -> list:
+    """ Stacks loaded by `import app` """
+    code = (f"import json, sys, app; "
+            f"print(json.dumps([name for name in {list(LAZY_STACKS.values())!r} if name in sys.modules]))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=app_dir, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startup time of console mode")
+    parser.add_argument('--repeat', type=int, default=10, help="number of runs of each command")
+    parser.add_argument('--json', help="write results to JSON file")
+    args = parser.parse_args()
+
+    commands = {
+        'python (empty)': [sys.executable, '-c', 'pass'],
+        'import app': [sys.executable, '-c', 'import app'],
+        'app.py --help': [sys.executable, 'app.py', '--help'],
+    }
+    for stack, module in LAZY_STACKS.items():
+        commands[f"import {module} ({stack})"] = [sys.executable, '-c', f"import {module}"]
+    rows = []
+    print(f"{'command':<40}{'median (ms)':>12}{'min (ms)':>10}")
+    for name, command in commands.items():
+        times = run_times(command, args.repeat)
+        if times is None:
+            rows.append({'command': name, 'error': 'failed'})
+            print(f"{name:<40}{'failed (not installed?)':>22}")
+            continue
+        row = {'command': name, 'median_ms': statistics.median(times) * 1000, 'min_ms': min(times) * 1000}
+        rows.append(row)
+        print(f"{name:<40}{row['median_ms']:>12.1f}{row['min_ms']:>10.1f}")
+    stacks = loaded_stacks()
+    print(f"Stacks loaded by `import app`: {', '.join(stacks) if stacks else 'none'}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'repeat': args.repeat, 'results': rows, 'loaded_stacks': stacks}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,518 @@
 """
-This code to support remote update translation on Odoo from XMLRPC request
+This code to support remote update translation and remote upgrade modules on Odoo from XMLRPC request
 """
-from odoo import models
+import base64
+import cProfile
+import hashlib
+import json
+import logging
+import marshal
+import os
+import pstats
+import socket
+import threading
+import time
+import traceback
+import uuid
+from contextlib import nullcontext
+
+from odoo import api, models, sql_db, tools
+from odoo.exceptions import AccessError
+from odoo.modules.module import get_module_path
+from odoo.modules.registry import Registry
+
+# version of this patch, the client reads it by `remote_patch_info` to know which functions are supported
+PATCH_VERSION = 6
+PATCH_FEATURES = ['remote_update_translation', 'remote_upgrade_start', 'remote_upgrade_modules', 'translation_checksum',
+                  'translation_languages', 'profile']
+# config parameter of checksums of translation files loaded by `remote_update_translation`, one per language
+TRANSLATION_CHECKSUM_PARAM = 'remote_update_translation.checksums.%s'
+# a running upgrade job writes its heartbeat every interval, it is lost when the heartbeat is older than the timeout
+JOB_HEARTBEAT_INTERVAL = 10
+JOB_HEARTBEAT_TIMEOUT = 60
+
+
+_logger = logging.getLogger(__name__)
+_progress_lock = threading.Lock()
+_job_lock = threading.Lock()
+_progress_filters = []
+_loading_logger = logging.getLogger('odoo.modules.loading')
+_loading_level = None
+
+
+def _job_file(dbname: str, job_id: str) -> str:
+    job_dir = os.path.join(tools.config['data_dir'], 'remote_upgrade_jobs', dbname)
+    os.makedirs(job_dir, exist_ok=True)
+    return os.path.join(job_dir, f"{job_id}.json")
+
+
+def _write_job(dbname: str, job: dict):
+    # job is stored in file, status request can be served by any worker on the same host
+    job_file = _job_file(dbname, job['job_id'])
+    # the job thread and its heartbeat thread write the same file
+    with _job_lock:
+        with open(job_file + '.tmp', 'w') as f:
+            json.dump(dict(job), f, default=str)
+        os.replace(job_file + '.tmp', job_file)
+
+
+def _read_job(dbname: str, job_id: str):
+    job_file = _job_file(dbname, os.path.basename(job_id))
+    if not os.path.isfile(job_file):
+        return None
+    with open(job_file) as f:
+        return json.load(f)
+
+
+def _job_lost_reason(job: dict) -> str:
+    """ Reason a running job is lost: its process is gone (same host) or its heartbeat is stale, empty if alive """
+    if job.get('host') == socket.gethostname() and job.get('pid'):
+        try:
+            os.kill(job['pid'], 0)
+        except ProcessLookupError:
+            return f"the server process {job['pid']} running the job is gone (restarted or worker recycled)"
+        except PermissionError:
+            pass
+    heartbeat = job.get('heartbeat') or job['start']
+    if time.time() - heartbeat > JOB_HEARTBEAT_TIMEOUT:
+        return f"no heartbeat of the job for {time.time() - heartbeat:.0f} seconds"
+    return ''
+
+
+def _translation_checksum(module_name: str, lang: str) -> str:
+    """ Checksum of the translation files of the module loaded for the language (base language file then language) """
+    digest = hashlib.sha256()
+    path = get_module_path(module_name, display_warning=False)
+    if path:
+        for folder in ('i18n', 'i18n_extra'):
+            for code in sorted({lang.split('_')[0], lang}):
+                po_file = os.path.join(path, folder, f"{code}.po")
+                if os.path.isfile(po_file):
+                    digest.update(f"{folder}/{code}.po\0".encode())
+                    with open(po_file, 'rb') as f:
+                        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _query_count() -> int:
+    """ Number of SQL queries executed by the current thread (Odoo 13+), or by the process on older versions """
+    count = getattr(threading.current_thread(), 'query_count', None)
+    return sql_db.sql_counter if count is None else count
+
+
+class _CallProfile:
+    """
+    Profile the calls of the current thread by cProfile when `enabled`, the report has the top functions by own time
+    and by cumulative time, the number of SQL queries, and the full profile (pstats data in base64) when `full`
+    """
+
+    def __init__(self, enabled: bool, top: int = 20, full: bool = False):
+        self.enabled = enabled
+        self.profiler = cProfile.Profile() if enabled else None
+        self.top = top
+        self.full = full
+        self.error = ''
+        self.start = 0.0
+        self.duration = 0.0
+        self.queries = 0
+
+    def __enter__(self):
+        self.start, self.queries = time.time(), _query_count()
+        if self.profiler:
+            try:
+                self.profiler.enable()
+            except ValueError as e:
+                # Python 3.12+ allows one profiler at a time, another request is profiled
+                self.error, self.profiler = e.__str__(), None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.profiler:
+            self.profiler.disable()
+        self.duration = time.time() - self.start
+        self.queries = _query_count() - self.queries
+
+    def report(self) -> dict:
+        # empty when not enabled, XML-RPC of Odoo does not allow None
+        if not self.enabled:
+            return {}
+        report = {'duration': self.duration, 'queries': self.queries, 'error': self.error, 'total_calls': 0,
+                  'functions': [], 'cumulative': [], 'profile_data': ''}
+        if self.profiler:
+            stats = pstats.Stats(self.profiler)
+            rows = [{'function': self.function_name(*func), 'calls': calls, 'tottime': tottime, 'cumtime': cumtime}
+                    for func, (_, calls, tottime, cumtime, _) in stats.stats.items()]
+            report['total_calls'] = stats.total_calls
+            report['functions'] = sorted(rows, key=lambda row: -row['tottime'])[:self.top]
+            report['cumulative'] = sorted(rows, key=lambda row: -row['cumtime'])[:self.top]
+            if self.full:
+                # same content as `pstats.Stats.dump_stats`, the client writes it to a .prof file
+                report['profile_data'] = base64.b64encode(marshal.dumps(stats.stats)).decode()
+        return report
+
+    @staticmethod
+    def function_name(file_name: str, line: int, name: str) -> str:
+        if file_name == '~' and line == 0:
+            # built-in function
+            return name
+        return f"{os.path.join(*file_name.split(os.sep)[-3:])}:{line}({name})"
+
+
+class _LoadingProgress(logging.Filter):
+    """
+    Observe module loading messages of logger `odoo.modules.loading` in one thread to report progress of the job,
+    the debug level is enabled while observing but the debug messages are still filtered out from logs
+    """
+
+    def __init__(self, dbname: str, job: dict):
+        super().__init__()
+        self.dbname = dbname
+        self.job = job
+        self.thread_id = threading.get_ident()
+        self.last_write = 0.0
+
+    def __enter__(self):
+        global _loading_level
+        with _progress_lock:
+            if not _progress_filters:
+                _loading_level = _loading_logger.level
+                _loading_logger.setLevel(logging.DEBUG)
+            _progress_filters.append(self)
+            _loading_logger.addFilter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with _progress_lock:
+            _loading_logger.removeFilter(self)
+            _progress_filters.remove(self)
+            if not _progress_filters:
+                _loading_logger.setLevel(_loading_level)
+
+    def filter(self, record):
+        if self.job is not None and record.thread == self.thread_id and record.msg == 'Loading module %s (%d/%d)':
+            self.job['current'], self.job['loaded'], self.job['total'] = record.args[:3]
+            if time.time() - self.last_write >= 1:
+                self.last_write = time.time()
+                self.job['elapsed'] = time.time() - self.job['start']
+                _write_job(self.dbname, self.job)
+        return record.levelno >= (_loading_level or logging.INFO)
+
+
+class _LogCollector(logging.Handler):
+    def __init__(self, callback, level=logging.WARNING):
+        super().__init__(level)
+        self.callback = callback
+
+    def emit(self, record):
+        self.callback(record)
+
+
+class _UpgradeProfile(_LoadingProgress):
+    """
+    Time of loading each module and each of its data files in one thread, from messages of logger
+    `odoo.modules.loading`, warnings and errors logged by Odoo in the thread are collected for the module being loaded
+    """
+
+    def __init__(self, dbname: str):
+        super().__init__(dbname, None)
+        self.modules = {}
+        self.errors = []
+        self.current = None
+        self.current_file = None
+        self.handler = _LogCollector(self.collect)
+
+    def __enter__(self):
+        logging.getLogger('odoo').addHandler(self.handler)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(time.time())
+        logging.getLogger('odoo').removeHandler(self.handler)
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+    def close(self, now: float, module: bool = True):
+        queries = _query_count()
+        if self.current_file:
+            self.current_file['duration'] = now - self.current_file.pop('start')
+            self.current_file['queries'] = queries - self.current_file.pop('query_start')
+            self.current_file = None
+        if module and self.current:
+            self.current['duration'] = now - self.current.pop('start')
+            self.current['queries'] = queries - self.current.pop('query_start')
+            self.current = None
+
+    def filter(self, record):
+        if record.thread == self.thread_id:
+            now = time.time()
+            if record.msg == 'Loading module %s (%d/%d)':
+                self.close(now)
+                self.current = {'start': now, 'duration': 0.0, 'query_start': _query_count(), 'queries': 0,
+                                'data_files': [], 'records': 0, 'errors': []}
+                self.modules[record.args[0]] = self.current
+            elif record.msg == 'loading %s/%s' and self.current:
+                self.close(now, module=False)
+                self.current_file = {'file': record.args[1], 'start': now, 'duration': 0.0,
+                                     'query_start': _query_count(), 'queries': 0}
+                self.current['data_files'].append(self.current_file)
+        return super().filter(record)
+
+    def collect(self, record):
+        if record.thread != self.thread_id:
+            return
+        error = {
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'traceback': ''.join(traceback.format_exception(*record.exc_info)) if record.exc_info else '',
+        }
+        (self.current['errors'] if self.current else self.errors).append(error)
+
+
+class _JobHeartbeat:
+    """ Write the heartbeat of the job to its file in a thread, independent of the module loading messages """
+
+    def __init__(self, dbname: str, job: dict):
+        self.dbname = dbname
+        self.job = job
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"remote_upgrade_heartbeat_{job['job_id']}", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop_event.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stop_event.wait(JOB_HEARTBEAT_INTERVAL):
+            self.job['heartbeat'] = time.time()
+            self.job['elapsed'] = time.time() - self.job['start']
+            _write_job(self.dbname, self.job)
+
+
+def _run_upgrade_job(dbname: str, uid: int, ids: list, job: dict):
+    """ Upgrade modules in a new cursor, the job is updated with progress and the final result """
+    thread = threading.current_thread()
+    thread.dbname = dbname
+    thread.uid = uid
+    # Environment.manage is required before Odoo 15 and removed later
+    manage = getattr(api.Environment, 'manage', nullcontext)
+    with _JobHeartbeat(dbname, job):
+        try:
+            with manage(), _LoadingProgress(dbname, job):
+                with Registry(dbname).cursor() as cr:
+                    env = api.Environment(cr, uid, {})
+                    job['result'] = env['ir.module.module'].browse(ids).button_immediate_upgrade()
+            # the upgrade creates a new registry, read the result from it
+            with manage(), Registry(dbname).cursor() as cr:
+                env = api.Environment(cr, uid, {})
+                job['results'] = {
+                    module.name: {'state': module.state, 'latest_version': module.latest_version,
+                                  'installed_version': module.installed_version}
+                    for module in env['ir.module.module'].browse(ids)
+                }
+            job['state'] = 'done'
+        except Exception as e:
+            _logger.exception("Remote upgrade job %s failed", job['job_id'])
+            job['state'] = 'failed'
+            job['error'] = e.__str__()
+            job['traceback'] = traceback.format_exc()
+    job['current'] = ''
+    job['elapsed'] = time.time() - job['start']
+    _write_job(dbname, job)
+
 
 class IrModuleModule(models.Model):
     _inherit = "ir.module.module"
 
-    def remote_update_translation(self, filter_lang: str = None):
+    @api.model
+    def remote_patch_info(self):
+        return {'version': PATCH_VERSION, 'features': PATCH_FEATURES}
+
+    def remote_update_translation(self, filter_lang=None, force: bool = False, profile: bool = False,
+                                  profile_top: int = 20, profile_file: bool = False):
+        """
+        Update translation of the modules, the client can call it on chunks of modules to report progress. A module is
+        skipped when its translation files are not changed since the last successful load (checksum per module and
+        language in config parameters), unless `force`. The response lists the loaded and skipped modules, `saved` is
+        the estimated time saved by skipping (average load time of a module).
+        :param filter_lang: language code or list of codes, all requested languages of a module are loaded in one visit
+            of the module (modules changed in the same languages are loaded together), `languages` of the response has
+            the result of each language, its `duration` is its share of the load time of the modules
+        :param profile: profile the load of translations, the response has key `profile` (see `_CallProfile`) with the
+            `profile_top` functions, and the full profile when `profile_file`
+        """
+        start_time = time.time()
+        params = self.env['ir.config_parameter'].sudo()
+        if not filter_lang:
+            langs = [code for code, _ in self.env['res.lang'].get_installed()]
+        else:
+            langs = [filter_lang] if isinstance(filter_lang, str) else list(dict.fromkeys(filter_lang))
+        stored = {lang: json.loads(params.get_param(TRANSLATION_CHECKSUM_PARAM % lang) or '{}') for lang in langs}
+        checksums = {lang: {module.name: _translation_checksum(module.name, lang) for module in self} for lang in langs}
+        # group modules by their changed languages
+        groups = {}
+        for module in self:
+            changed = tuple(lang for lang in langs if force or (
+                stored[lang].get('checksums', {}).get(module.name) != checksums[lang][module.name]))
+            if changed:
+                groups[changed] = groups.get(changed, self.browse()) | module
+        languages = {lang: {'loaded': [], 'skipped': [], 'saved': 0.0, 'duration': 0.0} for lang in langs}
+        call_profile = _CallProfile(profile, profile_top, profile_file)
         try:
-            self.with_context(overwrite=self.env.context.get('overwrite'))._update_translations(filter_lang=filter_lang)
+            with call_profile:
+                for group_langs, group in groups.items():
+                    group_start = time.time()
+                    group.with_context(overwrite=self.env.context.get('overwrite'))._update_translations(filter_lang=list(group_langs))
+                    group_duration = time.time() - group_start
+                    for lang in group_langs:
+                        languages[lang]['loaded'] += group.mapped('name')
+                        languages[lang]['duration'] += group_duration / len(group_langs)
         except Exception as e:
             return {
                 'status': False,
                 'error': e.__str__()
             }
-        return {"status": True, 'error': ''}
+        loaded = self.browse()
+        for group in groups.values():
+            loaded |= group
+        for lang in langs:
+            data, result = stored[lang], languages[lang]
+            result['skipped'] = [module.name for module in self if module.name not in result['loaded']]
+            data.setdefault('checksums', {}).update({name: checksums[lang][name] for name in result['loaded']})
+            if result['loaded']:
+                data['seconds_per_module'] = result['duration'] / len(result['loaded'])
+            result['saved'] = len(result['skipped']) * data.get('seconds_per_module', 0.0)
+            params.set_param(TRANSLATION_CHECKSUM_PARAM % lang, json.dumps(data))
+        return {
+            'status': True,
+            'error': '',
+            'modules': len(self),
+            'loaded': loaded.mapped('name'),
+            'skipped': (self - loaded).mapped('name'),
+            'saved': sum(result['saved'] for result in languages.values()),
+            'duration': time.time() - start_time,
+            'languages': languages,
+            'profile': call_profile.report(),
+        }
+
+    def remote_upgrade_start(self):
+        """
+        Start upgrade of the modules in background and return the job id at once, the client polls progress and result
+        by `remote_upgrade_status`. The job runs in a thread of the server process received the request, on prefork
+        server (workers > 0) the worker process can be recycled before the job is done, threaded server is preferred:
+        the job is reported `lost` when its process is gone or its heartbeat is stale.
+        """
+        if not self.env.user.has_group('base.group_system'):
+            raise AccessError("Only administrators can upgrade modules")
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'state': 'running',
+            'modules': self.mapped('name'),
+            'start': time.time(),
+            'heartbeat': time.time(),
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'elapsed': 0.0,
+            'loaded': 0,
+            'total': 0,
+            'current': '',
+            'result': None,
+            'results': {},
+            'error': '',
+            'traceback': '',
+        }
+        _write_job(self.env.cr.dbname, job)
+        threading.Thread(target=_run_upgrade_job, args=(self.env.cr.dbname, self.env.uid, self.ids, job),
+                         name=f"remote_upgrade_{job['job_id']}", daemon=True).start()
+        return {'job_id': job['job_id']}
+
+    @api.model
+    def remote_upgrade_modules(self, names: list, data_files: bool = True, profile: bool = False, profile_top: int = 20,
+                               profile_file: bool = False):
+        """
+        Upgrade the installed modules of the names in one registry reload and return the result of each module: load
+        time, time of each data file (`data_files`), number of records written (external ids created or updated by the
+        data files), number of SQL queries, warnings and errors logged while loading, with tracebacks. Modules upgraded
+        with the requested ones (they depend on them) are in the result too.
+        :param profile: profile the upgrade, the response has key `profile` (see `_CallProfile`) with the `profile_top`
+            functions, and the full profile when `profile_file`
+        """
+        if not self.env.user.has_group('base.group_system'):
+            raise AccessError("Only administrators can upgrade modules")
+        start_time = time.time()
+        cr = self.env.cr
+        modules = self.search([('name', 'in', names)])
+        states = {module.name: module.state for module in modules}
+        to_upgrade = modules.filtered(lambda module: module.state == 'installed')
+        result = {
+            'status': False,
+            'result': {},
+            'error': '',
+            'traceback': '',
+            'duration': 0.0,
+            'missing': [name for name in names if name not in states],
+            'not_installed': {name: state for name, state in states.items() if state != 'installed'},
+            'modules': {},
+            'errors': [],
+            'profile': {},
+        }
+        if not to_upgrade:
+            result['error'] = "No installed module to upgrade"
+            return result
+        # write_date of external ids written by data files is the time of the upgrade transaction, after this one
+        cr.execute("SELECT now() at time zone 'UTC'")
+        upgrade_start = cr.fetchone()[0]
+        call_profile = _CallProfile(profile, profile_top, profile_file)
+        with _UpgradeProfile(cr.dbname) as upgrade_profile, call_profile:
+            try:
+                result['result'] = to_upgrade.button_immediate_upgrade() or {}
+                result['status'] = True
+            except Exception as e:
+                _logger.exception("Remote upgrade of modules %s failed", to_upgrade.mapped('name'))
+                cr.rollback()
+                result['error'] = e.__str__()
+                result['traceback'] = traceback.format_exc()
+        # the upgrade commits and creates a new registry, read the result by SQL
+        loaded = {name: info for name, info in upgrade_profile.modules.items()
+                  if name in states or info['data_files'] or info['errors']}
+        cr.execute("SELECT name, state, latest_version FROM ir_module_module WHERE name IN %s",
+                   [tuple(set(loaded) | set(states))])
+        versions = {name: (state, latest_version) for name, state, latest_version in cr.fetchall()}
+        cr.execute("SELECT module, count(*) FROM ir_model_data WHERE module IN %s AND write_date >= %s GROUP BY module",
+                   [tuple(loaded) or ('',), upgrade_start])
+        records = dict(cr.fetchall())
+        for name in set(loaded) | set(to_upgrade.mapped('name')):
+            info = loaded.get(name, {'duration': 0.0, 'queries': 0, 'data_files': [], 'errors': []})
+            state, latest_version = versions.get(name, ('', ''))
+            result['modules'][name] = {
+                'requested': name in states,
+                'state': state,
+                'latest_version': latest_version or '',
+                'duration': info['duration'],
+                'data_files': info['data_files'] if data_files else [],
+                'data_file_count': len(info['data_files']),
+                'records': records.get(name, 0),
+                'queries': info['queries'],
+                'errors': info['errors'],
+            }
+        result['errors'] = upgrade_profile.errors
+        result['profile'] = call_profile.report()
+        result['duration'] = time.time() - start_time
+        return result
+
+    @api.model
+    def remote_upgrade_status(self, job_id: str):
+        job = _read_job(self.env.cr.dbname, job_id)
+        if not job:
+            return {'job_id': job_id, 'state': 'unknown'}
+        if job['state'] == 'running':
+            job['elapsed'] = time.time() - job['start']
+            reason = _job_lost_reason(job)
+            if reason:
+                job['state'] = 'lost'
+                job['error'] = f"Upgrade job is lost: {reason}, the upgrade may be partly done"
+                _write_job(self.env.cr.dbname, job)
+        return job